@@ -0,0 +1,99 @@
+import numpy as np
+from sweep import Sweep, SweepResult
+
+
+def interval_errors(x, y):
+    """
+    Local error estimate of the piecewise linear interpolant on every interval
+    [x_i, x_i+1]: the largest distance at the midpoint between the chord and
+    the parabolas through the neighbouring triplets of samples.
+
+    Args:
+        x: sorted sample points, shape (n,), n >= 3
+        y: samples, shape (n, k)
+
+    Returns:
+        errors of shape (n - 1,), maximum over the k columns
+    """
+    mid = 0.5 * (x[:-1] + x[1:])
+    chord = 0.5 * (y[:-1] + y[1:])
+    errors = np.zeros(len(x) - 1)
+    for first in range(len(x) - 2):
+        xs, ys = x[first:first + 3], y[first:first + 3]
+        # Lagrange parabola through the triplet, at the midpoints of its two intervals
+        for i in (first, first + 1):
+            basis = [np.prod([(mid[i] - xs[m]) / (xs[l] - xs[m]) for m in range(3) if m != l])
+                     for l in range(3)]
+            parabola = sum(b * ys[l] for (l, b) in enumerate(basis))
+            errors[i] = max(errors[i], np.max(np.abs(parabola - chord[i])))
+    return errors
+
+
+def refine(evaluate, x_min, x_max, n_initial=5, tol=1e-3, budget=40, batch=None):
+    """
+    Adaptively sample y = evaluate(x) on [x_min, x_max]: start from a uniform
+    grid and bisect the intervals whose local error estimate exceeds `tol`
+    times the range of y, worst first, until every interval is below the
+    tolerance or `budget` points have been evaluated.
+
+    Args:
+        evaluate: callable taking an array of points and returning an array
+                  of shape (len(points),) or (len(points), k); every call is a
+                  batch that can be run in parallel
+        x_min, x_max: sampled interval
+        n_initial: points of the initial uniform grid (at least 3)
+        tol: tolerance relative to the range of y
+        budget: maximum number of evaluated points
+        batch: maximum number of points added per round, all the needed ones when None
+
+    Points where the evaluation failed (any non-finite sample) are kept but
+    never refined around: the intervals touching them are not bisected, and
+    the error estimate of the others only uses the successful points.
+
+    Returns:
+        sorted points x, samples y of shape (len(x), k) and the boolean mask
+        of the failed points
+    """
+    x = np.linspace(x_min, x_max, max(n_initial, 3))
+    y = np.asarray(evaluate(x), dtype=np.float64).reshape(len(x), -1)
+    while len(x) < budget:
+        ok = np.all(np.isfinite(y), axis=1)
+        if np.sum(ok) < 3:
+            break
+        scale = np.max(y[ok]) - np.min(y[ok])
+        # intervals between two successful points, indexed like those of x[ok]
+        errors = np.full(len(x) - 1, -np.inf)
+        both = ok[:-1] & ok[1:]
+        errors[both] = interval_errors(x[ok], y[ok])[np.cumsum(ok)[:-1][both] - 1]
+        bad = np.flatnonzero(errors > tol * (scale if scale > 0 else 1.0))
+        if len(bad) == 0:
+            break
+        limit = budget - len(x) if batch is None else min(batch, budget - len(x))
+        bad = bad[np.argsort(errors[bad])[::-1]][:limit]
+        new_x = 0.5 * (x[bad] + x[bad + 1])
+        new_y = np.asarray(evaluate(new_x), dtype=np.float64).reshape(len(new_x), -1)
+        order = np.argsort(np.concatenate([x, new_x]), kind="stable")
+        x = np.concatenate([x, new_x])[order]
+        y = np.concatenate([y, new_y])[order]
+    return x, y, ~np.all(np.isfinite(y), axis=1)
+
+
+def refine_sweep(launch, name, x_min, x_max, modes, fixed=None, log=None, **kwargs):
+    """
+    Adaptive version of a one-axis `Sweep` over the Launch attribute `name`:
+    the error estimate is the worst over all the modes, every refinement round
+    runs as one parallel sweep, and `log` makes the whole study resumable.
+    Keyword arguments are forwarded to `refine`.
+
+    Returns:
+        SweepResult with dimensions (name, "mode") at the sampled points, NaN
+        where a run failed
+    """
+    def evaluate(points):
+        return Sweep({name: points}, modes, fixed).run(launch, log=log).values
+
+    x, y, failed = refine(evaluate, x_min, x_max, **kwargs)
+    if np.any(failed):
+        print(f"{np.sum(failed)} failed {name} points, not refined around: {x[failed].tolist()}")
+    coords = Sweep({name: x}, modes, fixed).coords
+    return SweepResult(y, [name, "mode"], coords)
@@ -0,0 +1,69 @@
+import os
+import glob
+import hashlib
+import subprocess
+import toml
+from cache import hash_file
+
+# everything cargo looks at to produce the binary
+BUILD_INPUTS = ['Cargo.toml', 'Cargo.lock']
+SOURCE_PATTERN = 'src/**/*.rs'
+
+_binary_hashes = {}
+
+
+def source_fingerprint():
+    """
+    Hash of the Rust sources and of the cargo manifest and lock file.
+    """
+    digest = hashlib.sha256()
+    for path in BUILD_INPUTS + sorted(glob.glob(SOURCE_PATTERN, recursive=True)):
+        digest.update(path.encode())
+        digest.update(hash_file(path).encode())
+    return digest.hexdigest()
+
+
+def binary_fingerprint(binary):
+    """
+    Hash of the compiled binary, recomputed only when its size or mtime change.
+    """
+    try:
+        st = os.stat(binary)
+    except FileNotFoundError:
+        return ''
+    stamp = (st.st_size, st.st_mtime_ns)
+    if _binary_hashes.get(binary, (None, None))[0] != stamp:
+        _binary_hashes[binary] = (stamp, hash_file(binary))
+    return _binary_hashes[binary][1]
+
+
+def fingerprint_file(binary):
+    return os.path.join(os.path.dirname(binary), '.' + os.path.basename(binary) + '.fingerprint')
+
+
+def is_up_to_date(binary):
+    """
+    True if the binary exists and was built by `build` from the current sources.
+    """
+    try:
+        record = toml.load(fingerprint_file(binary))
+    except (FileNotFoundError, toml.TomlDecodeError):
+        return False
+    return (record.get('sources') == source_fingerprint()
+            and record.get('binary') == binary_fingerprint(binary) != '')
+
+
+def build(binary, command=('cargo', 'build', '--release')):
+    """
+    Run cargo and record the fingerprint of what was built.
+
+    Raises:
+        RuntimeError: if the build fails
+    """
+    sources = source_fingerprint()
+    result = subprocess.run(list(command), capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError("cargo build failed:\n" + result.stderr[-4000:])
+    with open(fingerprint_file(binary), 'w') as f:
+        toml.dump({"sources": sources, "binary": binary_fingerprint(binary)}, f)
+    return result
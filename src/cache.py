@@ -0,0 +1,160 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+import toml
+
+# config entries that only decide where the outputs are written
+OUTPUT_KEYS = ("file", "output")
+
+
+def hash_file(path):
+    """
+    SHA-256 of the contents of a file, '' if the file does not exist.
+    """
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    except FileNotFoundError:
+        return ''
+    return digest.hexdigest()
+
+
+def normalize_config(config):
+    """
+    Canonical text of a normalized config, without the output locations.
+    """
+    config = {k: v for (k, v) in config.items() if k not in OUTPUT_KEYS}
+    return json.dumps(config, sort_keys=True, default=repr)
+
+
+class RunCache:
+    """
+    Content-addressed store of simulation results. An entry is keyed on the
+    normalized config, the input data files the run reads and the fingerprint
+    of the binary, and holds the final velocity plus copies of the output
+    files. The least recently used entries are evicted above `max_size` bytes.
+    """
+    def __init__(self, folder='results/cache/', max_size=20e9):
+        self.folder = folder
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.total = None  # running estimate of the stored bytes
+        os.makedirs(folder, exist_ok=True)
+
+    def key(self, config_path, input_files, fingerprint):
+        """
+        Args:
+            config_path: config file passed to the binary
+            input_files: data files read by the binary for this config
+            fingerprint: build fingerprint of the binary
+
+        Returns:
+            hex digest identifying the run
+        """
+        digest = hashlib.sha256()
+        digest.update(normalize_config(toml.load(config_path)).encode())
+        for path in sorted(input_files):
+            digest.update(path.encode())
+            digest.update(hash_file(path).encode())
+        digest.update(fingerprint.encode())
+        return digest.hexdigest()
+
+    def entry(self, key):
+        return os.path.join(self.folder, key)
+
+    def get(self, key, outputs):
+        """
+        Look up a run and restore its output files.
+
+        Args:
+            key: run key
+            outputs: dict {role: path} where the stored files are copied
+
+        Returns:
+            (final velocity, termination reason or None if not recorded), or None on a miss
+        """
+        entry = self.entry(key)
+        try:
+            meta = toml.load(os.path.join(entry, 'entry.toml'))
+            for (role, path) in outputs.items():
+                if role in meta['files']:
+                    shutil.copyfile(os.path.join(entry, meta['files'][role]), path)
+            os.utime(entry)  # mark as recently used
+        except (FileNotFoundError, KeyError):
+            return None
+        return float(meta['velocity']), meta.get('termination')
+
+    def put(self, key, velocity, outputs, termination=None):
+        """
+        Store a run.
+
+        Args:
+            key: run key
+            velocity: final velocity returned by the binary
+            outputs: dict {role: path} of the files produced by the run
+            termination: how the run ended, see `Launch.termination`
+        """
+        entry = self.entry(key)
+        if os.path.exists(entry):
+            return
+        # build the entry aside and move it in place, so readers never see half of it
+        staging = tempfile.mkdtemp(prefix='.staging_', dir=self.folder)
+        meta = {"velocity": float(velocity), "created": time.time(), "files": {}}
+        if termination is not None:
+            meta["termination"] = termination
+        for (role, path) in outputs.items():
+            if os.path.exists(path):
+                name = role + os.path.splitext(path)[1]
+                shutil.copyfile(path, os.path.join(staging, name))
+                meta["files"][role] = name
+        with open(os.path.join(staging, 'entry.toml'), 'w') as f:
+            toml.dump(meta, f)
+        size = self.size(staging)
+        try:
+            os.rename(staging, entry)
+        except OSError:
+            # stored meanwhile by a concurrent run
+            shutil.rmtree(staging, ignore_errors=True)
+            return
+        with self.lock:
+            if self.total is not None:
+                self.total += size
+            full = self.total is None or self.total > self.max_size
+        if full:
+            self.evict()
+
+    def size(self, entry):
+        return sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in `max_size`.
+        """
+        with self.lock:
+            entries = []
+            for name in os.listdir(self.folder):
+                entry = self.entry(name)
+                if name.startswith('.') or not os.path.isdir(entry):
+                    continue
+                try:
+                    entries.append((os.path.getmtime(entry), self.size(entry), entry))
+                except FileNotFoundError:
+                    continue
+            total = sum(size for (_, size, _) in entries)
+            for (_, size, entry) in sorted(entries):
+                if total <= self.max_size:
+                    break
+                shutil.rmtree(entry, ignore_errors=True)
+                total -= size
+            self.total = total
+
+    def clear(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+        os.makedirs(self.folder, exist_ok=True)
+        self.total = 0
@@ -0,0 +1,215 @@
+import os
+import time
+import shutil
+import sqlite3
+import hashlib
+import contextlib
+import numpy as np
+import pandas as pd
+from enum import Enum
+from cache import normalize_config
+
+# columns of every run, the parameters of the launch are added as further columns
+RUN_COLUMNS = {
+    "id":          "INTEGER PRIMARY KEY AUTOINCREMENT",
+    "key":         "TEXT NOT NULL",  # hash of the normalized config
+    "created":     "REAL NOT NULL",
+    "velocity":    "REAL",
+    "max_T":       "REAL",
+    "max_Q":       "REAL",
+    "runtime":     "REAL",
+    "termination": "TEXT",
+    "trajectory":  "TEXT",
+    "spectrum":    "TEXT",
+}
+
+
+def run_key(launch):
+    return hashlib.sha256(normalize_config(launch.get_config()).encode()).hexdigest()
+
+
+def column_value(value):
+    if isinstance(value, Enum):
+        return value.name
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def column_type(value):
+    if isinstance(value, str):
+        return "TEXT"
+    if isinstance(value, (bool, int)):
+        return "INTEGER"
+    return "REAL"
+
+
+def quote(name):
+    if not name.isidentifier():
+        raise ValueError(f"Invalid column name '{name}'")
+    return f'"{name}"'
+
+
+class Catalog:
+    """
+    Queryable record of the runs: a SQLite index with one row per run holding
+    its full parameter set (one column per Launch parameter, each indexed),
+    final velocity, max T and Q, runtime, termination and output paths. With
+    `keep_outputs` the trajectory and spectrum are copied in the catalog
+    folder as columnar .npy/.csv files, otherwise the paths of the run are
+    recorded, and dropped when the run was in a temporary workspace.
+    Runs served from the cache are recorded too, with no runtime.
+
+    Args:
+        folder: catalog folder, holding index.db and the kept outputs
+        keep_outputs: copy the outputs of every run in the catalog
+        summarize: compute max T and Q of every run, another full read of its trajectory
+    """
+    def __init__(self, folder='results/catalog/', keep_outputs=False, summarize=False):
+        self.folder = folder
+        self.keep_outputs = keep_outputs
+        self.summarize = summarize
+        self.path = os.path.join(folder, 'index.db')
+        os.makedirs(folder, exist_ok=True)
+        with self.transaction() as db:
+            columns = ", ".join(f"{quote(name)} {kind}" for (name, kind) in RUN_COLUMNS.items())
+            db.execute(f"CREATE TABLE IF NOT EXISTS runs ({columns})")
+            db.execute("CREATE INDEX IF NOT EXISTS runs_key ON runs (key)")
+
+    @contextlib.contextmanager
+    def transaction(self):
+        db = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+        finally:
+            db.close()
+
+    def columns(self, db):
+        return [row[1] for row in db.execute("PRAGMA table_info(runs)")]
+
+    def add_columns(self, db, parameters):
+        existing = set(self.columns(db))
+        for (name, value) in parameters.items():
+            if name not in existing:
+                db.execute(f"ALTER TABLE runs ADD COLUMN {quote(name)} {column_type(value)}")
+                db.execute(f"CREATE INDEX IF NOT EXISTS {quote('runs_' + name)} ON runs ({quote(name)})")
+
+    def record(self, launch, velocity, runtime=None, summary=None, outputs=None):
+        """
+        Add a run of `launch`, after it completed.
+
+        Args:
+            velocity: final velocity
+            runtime: wall-clock duration in seconds
+            summary: reductions of the trajectory as given by
+                     `Launch.trajectory_summary`, computed when None, the
+                     catalog `summarize`s and the trajectory exists
+            outputs: dict {role: path} of the outputs, `launch.outputs()` when None
+
+        Returns:
+            id of the run
+        """
+        parameters = {k: column_value(v) for (k, v) in launch.parameters().items()}
+        if outputs is None:
+            outputs = launch.outputs()
+        outputs = {role: path for (role, path) in outputs.items() if os.path.exists(path)}
+        if summary is None and self.summarize and "trajectory" in outputs:
+            summary = launch.trajectory_summary()
+        summary = summary or {}
+        row = dict(parameters, key=run_key(launch), created=time.time(),
+                   velocity=float(velocity), max_T=summary.get("max_T"), max_Q=summary.get("max_Q"),
+                   runtime=runtime, termination=launch.termination)
+        if not self.keep_outputs and not launch.temporary_workspace:
+            row.update({role: outputs.get(role) for role in ("trajectory", "spectrum")})
+        with self.transaction() as db:
+            self.add_columns(db, parameters)
+            names = ", ".join(quote(name) for name in row)
+            marks = ", ".join("?" for _ in row)
+            run_id = db.execute(f"INSERT INTO runs ({names}) VALUES ({marks})",
+                                list(row.values())).lastrowid
+            if self.keep_outputs:
+                kept = {}
+                for role in ("trajectory", "spectrum"):
+                    if role in outputs:
+                        kept[role] = os.path.join(self.folder, f"{run_id}_{role}{os.path.splitext(outputs[role])[1]}")
+                        shutil.copyfile(outputs[role], kept[role])
+                if kept:
+                    db.execute(f"UPDATE runs SET {', '.join(f'{r} = ?' for r in kept)} WHERE id = ?",
+                               list(kept.values()) + [run_id])
+        return run_id
+
+    def import_result(self, result, launch, fixed=None):
+        """
+        Record the cells of a `sweep.SweepResult` computed on `launch`, e.g. the
+        files of the interstellar studies, with no runtime or temperature.
+        `fixed` are the attributes set for every cell of the sweep.
+
+        Returns:
+            number of runs added
+        """
+        from sweep import Sweep, label_mode
+        axes = {d: result.coords[d] for d in result.dims if d != "mode"}
+        modes = [label_mode(label) for label in result.coords["mode"]]
+        cells = Sweep(axes, modes, fixed).cells()
+        for (cell, velocity) in zip(cells, np.asarray(result.values).ravel()):
+            if not np.isnan(velocity):
+                self.record(launch.with_overrides(cell), velocity, summary={}, outputs={})
+        return int(np.sum(~np.isnan(result.values)))
+
+    def query(self, columns=None, order_by="id", **filters):
+        """
+        Runs matching all the filters, as a DataFrame. A filter is a value,
+        a (low, high) range (either end can be None) or a list of values,
+        e.g. query(mode="delay", multilayer=["M1", "M2"], p_0=(10e9, 50e9)).
+        """
+        where, args = [], []
+        for (name, value) in filters.items():
+            if isinstance(value, tuple):
+                low, high = value
+                if low is not None:
+                    where.append(f"{quote(name)} >= ?")
+                    args.append(column_value(low))
+                if high is not None:
+                    where.append(f"{quote(name)} <= ?")
+                    args.append(column_value(high))
+            elif isinstance(value, (list, np.ndarray)):
+                where.append(f"{quote(name)} IN ({', '.join('?' for _ in value)})")
+                args.extend(column_value(v) for v in value)
+            else:
+                where.append(f"{quote(name)} = ?")
+                args.append(column_value(value))
+        select = "*" if columns is None else ", ".join(quote(c) for c in columns)
+        sql = f"SELECT {select} FROM runs"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {quote(order_by)}"
+        with self.transaction() as db:
+            return pd.read_sql_query(sql, db, params=args)
+
+    def values(self, column, order_by="id", **filters):
+        """
+        One column of the matching runs as a NumPy array.
+        """
+        return self.query([column], order_by, **filters)[column].to_numpy()
+
+    def lookup(self, launch, overrides):
+        """
+        Latest recorded velocity of every configuration, NaN if never run.
+
+        Args:
+            overrides: list of dicts {attribute: value}, as in `Launch.run_many`
+        """
+        velocities = np.full(len(overrides), np.nan, dtype=np.float64)
+        with self.transaction() as db:
+            for (i, override) in enumerate(overrides):
+                row = db.execute("SELECT velocity FROM runs WHERE key = ? ORDER BY id DESC LIMIT 1",
+                                 (run_key(launch.with_overrides(override)),)).fetchone()
+                if row is not None and row[0] is not None:
+                    velocities[i] = row[0]
+        return velocities
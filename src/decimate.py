@@ -0,0 +1,130 @@
+import numpy as np
+from numba import njit
+
+
+@njit(cache=True)
+def lttb_indices(x, y, n_out):
+    """
+    Largest-triangle-three-buckets downsampling: indices of the `n_out`
+    samples of (x, y) that best preserve the visual shape of the curve.
+    The first and last samples are always kept.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0] = 0
+    indices[n_out - 1] = n - 1
+    bucket = (n - 2) / (n_out - 2)
+    a = 0
+    for i in range(n_out - 2):
+        start = int(i * bucket) + 1
+        stop = int((i + 1) * bucket) + 1
+        # average of the next bucket is the third vertex of the triangles
+        next_start = stop
+        next_stop = min(int((i + 2) * bucket) + 1, n)
+        if i == n_out - 3:
+            next_start, next_stop = n - 1, n
+        x_avg = 0.0
+        y_avg = 0.0
+        for k in range(next_start, next_stop):
+            x_avg += x[k]
+            y_avg += y[k]
+        x_avg /= next_stop - next_start
+        y_avg /= next_stop - next_start
+
+        best = start
+        best_area = -1.0
+        for k in range(start, stop):
+            area = abs((x[a] - x_avg) * (y[k] - y[a]) - (x[a] - x[k]) * (y_avg - y[a]))
+            if area > best_area:
+                best_area = area
+                best = k
+        indices[i + 1] = best
+        a = best
+    return indices
+
+
+def lttb_mask(x, y, n_out):
+    """
+    Boolean mask of the samples kept by LTTB on each column of `y`, ignoring
+    NaNs; the first and last sample of every finite stretch are always kept.
+
+    Args:
+        x: array of shape (n,)
+        y: array of shape (n, columns)
+        n_out: point budget per column
+
+    Returns:
+        mask of the same shape as `y`
+    """
+    finite = np.isfinite(y)
+    mask = np.zeros(y.shape, dtype=bool)
+    mask[1:] |= finite[1:] & ~finite[:-1]
+    mask[:-1] |= finite[:-1] & ~finite[1:]
+    mask[0] |= finite[0]
+    mask[-1] |= finite[-1]
+    for j in range(y.shape[1]):
+        valid = np.flatnonzero(finite[:, j])
+        if len(valid) <= n_out:
+            mask[valid, j] = True
+        else:
+            kept = lttb_indices(x[valid], y[valid, j], n_out)
+            mask[valid[kept], j] = True
+    return mask
+
+
+def segments(x, y, c, mask=None):
+    """
+    Segments joining consecutive kept samples of every column of `y` in one
+    pass, skipping the NaN gaps, for a single LineCollection.
+
+    Args:
+        x: array of shape (n,)
+        y: array of shape (n, columns)
+        c: values of shape (n, columns) used to color the segments
+        mask: samples to keep, all the finite ones when None
+
+    Returns:
+        segments of shape (m, 2, 2) and the value of `c` at their start
+    """
+    n, columns = y.shape
+    finite = np.isfinite(y)
+    if mask is None:
+        mask = finite
+    # column-major flattening keeps every line contiguous
+    stretch = np.cumsum(~finite, axis=0).T.ravel()
+    line = np.repeat(np.arange(columns), n)
+    kept = np.flatnonzero((mask & finite).T.ravel())
+    start, stop = kept[:-1], kept[1:]
+    joined = (line[start] == line[stop]) & (stretch[start] == stretch[stop])
+    start, stop = start[joined], stop[joined]
+
+    xs = np.tile(x, columns)
+    ys = y.T.ravel()
+    result = np.empty((len(start), 2, 2))
+    result[:, 0, 0] = xs[start]
+    result[:, 0, 1] = ys[start]
+    result[:, 1, 0] = xs[stop]
+    result[:, 1, 1] = ys[stop]
+    return result, c.T.ravel()[start]
+
+
+def minmax_indices(y, n_out):
+    """
+    Indices of at most about `n_out` samples of `y` keeping the minimum and
+    the maximum of every bucket, so that spikes survive the downsampling.
+    The first and last samples are always kept.
+    """
+    n = len(y)
+    if n <= n_out:
+        return np.arange(n)
+    n_buckets = max(n_out // 2, 1)
+    size = n // n_buckets
+    body = np.asarray(y[:n_buckets * size]).reshape(n_buckets, size)
+    offsets = np.arange(n_buckets) * size
+    indices = [[0, n - 1], offsets + body.argmin(axis=1), offsets + body.argmax(axis=1)]
+    if n_buckets * size < n:
+        rest = np.asarray(y[n_buckets * size:])
+        indices.append(n_buckets * size + np.array([rest.argmin(), rest.argmax()]))
+    return np.unique(np.concatenate(indices))
@@ -1,17 +1,22 @@
+import os
+import threading
 import numpy as np
 from scipy.optimize import fsolve, brentq
 from scipy.interpolate import interp1d
 import numba
-from numba import njit
+from numba import njit, prange
 import pandas as pd
 import matplotlib.pyplot as plt
+from cache import hash_file
 
 # Physical constants
 h = 6.62607015e-34  # Planck constant (J⋅s)
 c = 299792458       # Speed of light (m/s)
 kB = 1.380649e-23   # Boltzmann constant (J/K)
 
-@njit
+TABLE_FOLDER = 'results/emission/'
+
+@njit(cache=True)
 def planck_spectrum(freq, T):
     """
     Compute Planck spectrum I(ω) = (ℏω³)/(2π²c² * (exp(ℏω/kBT) - 1))
@@ -29,26 +34,58 @@ def planck_spectrum(freq, T):
     hf_over_kT = h * freq / (kB * T)
     
     # Avoid overflow for large hf_over_kT
-    if hf_over_kT > 700:
+    if hf_over_kT > 700 or hf_over_kT <= 0:
         return 0.0
     
-    try:
-        exp_term = np.exp(hf_over_kT) - 1.0
-        if exp_term <= 0:
-            return 0.0
-        
-        return (h * freq**3) / (2 * np.pi**2 * c**2 * exp_term)
-    except:
-        return 0.0
+    return (h * freq**3) / (2 * np.pi**2 * c**2 * np.expm1(hf_over_kT))
 
-@njit
+@njit(cache=True)
 def integrand(freq, T, emissivity):
     """
     Compute the integrand: emissivity(freq) * I(freq, T)
     """
     return emissivity * planck_spectrum(freq, T)
 
-@njit
+@njit(cache=True)
+def quadrature_terms(frequencies, emissivities):
+    """
+    Temperature-independent part of the trapezoidal rule on the nodes:
+    ∫ ε(ω) * I(ω, T) dω ≈ Σ weights[i] / (exp(exponents[i] / T) - 1)
+
+    Returns:
+        weights: trapezoidal weight × ε × hω³/(2π²c²) of every node
+        exponents: hω/kB of every node
+    """
+    n = len(frequencies)
+    weights = np.zeros(n)
+    exponents = np.empty(n)
+    for i in range(n):
+        freq = frequencies[i]
+        # every node is shared by the intervals on its two sides
+        df = 0.0
+        if i > 0:
+            df += freq - frequencies[i - 1]
+        if i < n - 1:
+            df += frequencies[i + 1] - freq
+        weights[i] = 0.5 * df * emissivities[i] * (h * freq**3) / (2 * np.pi**2 * c**2)
+        exponents[i] = h * freq / kB
+    return weights, exponents
+
+@njit(cache=True)
+def planck_sum(T, weights, exponents):
+    """
+    Trapezoidal rule of `quadrature_terms` at the temperature T
+    """
+    if T <= 0:
+        return 0.0
+    integral = 0.0
+    for i in range(len(weights)):
+        hf_over_kT = exponents[i] / T
+        if 0 < hf_over_kT <= 700:
+            integral += weights[i] / np.expm1(hf_over_kT)
+    return integral
+
+@njit(cache=True)
 def compute_rhs_integral(T, frequencies, emissivities):
     """
     Compute the RHS integral using trapezoidal rule
@@ -62,22 +99,130 @@ def compute_rhs_integral(T, frequencies, emissivities):
     Returns:
         Integral value
     """
-    n = len(frequencies)
-    if n < 2:
+    if len(frequencies) < 2:
         return 0.0
-    
+    weights, exponents = quadrature_terms(frequencies, emissivities)
+    return planck_sum(T, weights, exponents)
+
+@njit(parallel=True, cache=True)
+def compute_rhs_integrals(temperatures, frequencies, emissivities):
+    """
+    `compute_rhs_integral` for an array of temperatures, in parallel
+    """
+    result = np.zeros(len(temperatures))
+    if len(frequencies) < 2:
+        return result
+    weights, exponents = quadrature_terms(frequencies, emissivities)
+    for k in prange(len(temperatures)):
+        result[k] = planck_sum(temperatures[k], weights, exponents)
+    return result
+
+@njit(cache=True)
+def planck_sum_derivatives(T, weights, exponents):
+    """
+    `planck_sum` and its first two temperature derivatives, for each node
+    d/dT [1/(e^x - 1)] = x e^x / (T (e^x - 1)²) with x = hω/kBT
+    """
     integral = 0.0
-    for i in range(n - 1):
-        freq1, freq2 = frequencies[i], frequencies[i + 1]
-        eps1, eps2 = emissivities[i], emissivities[i + 1]
-        
-        # Trapezoidal rule
-        df = freq2 - freq1
-        y1 = integrand(freq1, T, eps1)
-        y2 = integrand(freq2, T, eps2)
-        integral += 0.5 * df * (y1 + y2)
-    
-    return integral
+    first = 0.0
+    second = 0.0
+    if T <= 0:
+        return integral, first, second
+    for i in range(len(weights)):
+        x = exponents[i] / T
+        if 0 < x <= 700:
+            decay = np.exp(-x)
+            # 1 - e^-x, with expm1 only where the subtraction would cancel
+            one_minus = 1.0 - decay if x > 0.5 else -np.expm1(-x)
+            term = weights[i] * decay / one_minus
+            derivative = term * x / (T * one_minus)
+            integral += term
+            first += derivative
+            second += derivative * (2 * x / one_minus - x - 2) / T
+    return integral, first, second
+
+@njit(cache=True)
+def solve_integral_sequence(targets, weights, exponents, T_guess, rtol, max_iter):
+    """
+    Temperatures where `planck_sum` equals each target, solved in sequence.
+    Halley steps on log(integral) against log(T), warm-started from the
+    previous solution; every evaluation narrows a bracket of the root, and a
+    step leaving it is replaced by a geometric bisection, or by an expansion
+    by 4 while one side is still open.
+
+    Returns:
+        temperatures: 0 for targets <= 0, NaN where no convergence in max_iter evaluations
+        evaluations: integral evaluations of every target
+    """
+    n = len(targets)
+    temperatures = np.full(n, np.nan)
+    evaluations = np.zeros(n, dtype=np.int64)
+    T = T_guess
+    for k in range(n):
+        target = targets[k]
+        if target <= 0:
+            temperatures[k] = 0.0
+            continue
+        if not np.isfinite(target):
+            continue
+        if not (T > 0 and np.isfinite(T)):
+            T = T_guess
+        low = 0.0
+        high = np.inf
+        for _ in range(max_iter):
+            integral, first, second = planck_sum_derivatives(T, weights, exponents)
+            evaluations[k] += 1
+            if integral == target:
+                temperatures[k] = T
+                break
+            if integral < target:
+                low = max(low, T)
+            else:
+                high = min(high, T)
+            if integral <= 0 or first <= 0:
+                # all the emission underflows, far below the root
+                step = np.log(4.0)
+            else:
+                g = np.log(integral / target)
+                slope = T * first / integral
+                curvature = slope + T * T * second / integral - slope * slope
+                denominator = 2 * slope * slope - g * curvature
+                if denominator > 0:
+                    step = -2 * g * slope / denominator
+                else:
+                    step = -g / slope
+            T_new = T * np.exp(step)
+            if not (low < T_new < high):
+                if low > 0 and high < np.inf:
+                    T_new = np.sqrt(low * high)
+                elif high < np.inf:
+                    T_new = high / 4
+                else:
+                    T_new = low * 4
+            converged = abs(np.log(T_new / T)) <= rtol
+            T = T_new
+            if converged:
+                temperatures[k] = T
+                break
+    return temperatures, evaluations
+
+def increasing_part(T, I):
+    """
+    Points of a tabulated emission curve that are positive and strictly
+    increasing, so that it can be inverted by interpolation.
+    """
+    keep = (I > 0) & (I > np.maximum.accumulate(np.r_[-np.inf, I[:-1]]))
+    return T[keep], I[keep]
+
+def save_table(path, **arrays):
+    """
+    Write a table atomically, so that concurrent builders never read a partial file.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp, path)
 
 class EquilibriumSolver:
     """
@@ -93,7 +238,111 @@ class EquilibriumSolver:
             sort_idx = np.argsort(self.frequencies)
             self.frequencies = self.frequencies[sort_idx]
             self.emissivities = self.emissivities[sort_idx]
+        self.table_T = None
+        self.table_P = None
+        self.key = None  # hash of the emissivity data, the tables are stored when set
+        self.table_folder = TABLE_FOLDER
+        self.quadrature = quadrature_terms(self.frequencies, self.emissivities)
+        self.evaluations = None  # integral evaluations of every sample of the last solve_sequence
+
+    @classmethod
+    def from_file(cls, filename, diameter, folder=TABLE_FOLDER):
+        """
+        Solver of the emissivity data in `filename` (see `load_emissivity_data`)
+        whose emission curves are stored in `folder`, keyed by the hash of the
+        file: they are tabulated once per file and reused for any diameter.
+        """
+        solver = cls(*load_emissivity_data(filename), diameter)
+        solver.key = hash_file(filename) or None  # not stored for the sample data
+        solver.table_folder = folder
+        return solver
+
+    def table_path(self, T_min, T_max, n):
+        return os.path.join(self.table_folder, f"{self.key[:16]}_{T_min:g}_{T_max:g}_{n}.npz")
+
+    def emitted_power(self, T):
+        """
+        Emitted power 2πd² * ∫ ε(ω) * I(ω, T) dω for an array of temperatures
+        """
+        T = np.asarray(T, dtype=np.float64)
+        return self.coeff * compute_rhs_integrals(T.ravel(), self.frequencies, self.emissivities).reshape(T.shape)
+
+    def tabulate(self, T_min=1.0, T_max=1e4, n=4096):
+        """
+        Precompute the emitted power on a dense log-spaced temperature grid,
+        keeping the strictly increasing part of the curve so that it can be
+        inverted by interpolation. With a `key` (see `from_file`) the integrals
+        ∫ ε(ω) * I(ω, T) dω are loaded from the table folder, or stored there.
+        """
+        path = None if self.key is None else self.table_path(T_min, T_max, n)
+        if path is not None and os.path.exists(path):
+            with np.load(path) as table:
+                T, I = table["T"], table["I"]
+        else:
+            T = np.logspace(np.log10(T_min), np.log10(T_max), n)
+            T, I = increasing_part(T, compute_rhs_integrals(T, self.frequencies, self.emissivities))
+            if path is not None:
+                save_table(path, T=T, I=I)
+        self.table_T = T
+        self.table_P = self.coeff * I
+
+    def solve_temperatures(self, P_absorbed, polish=0):
+        """
+        Equilibrium temperatures of a whole array of absorbed powers at once,
+        by monotone (log-log linear) interpolation of the tabulated P(T) curve,
+        see `tabulate` (called with its defaults if needed).
+
+        Args:
+            P_absorbed: array of absorbed powers
+            polish: Newton iterations on the exact integral after the
+                    interpolation, with the slope of the table
+
+        Returns:
+            temperatures, 0 where P_absorbed <= 0 and NaN where it is NaN or
+            outside of the table
+        """
+        if self.table_T is None:
+            self.tabulate()
+        P_absorbed = np.asarray(P_absorbed, dtype=np.float64)
+        log_T = np.log(self.table_T)
+        log_P = np.log(self.table_P)
+        positive = P_absorbed > 0
+        log_target = np.log(np.where(positive, P_absorbed, 1.0))
+        T = np.exp(np.interp(log_target, log_P, log_T))
+        for _ in range(polish):
+            slope = np.interp(np.log(T), log_T, np.gradient(log_P, log_T))
+            P = self.emitted_power(T)
+            T = T - (P - P_absorbed) / (slope * P / T)
+        inside = (log_target >= log_P[0]) & (log_target <= log_P[-1])
+        return np.where(positive, np.where(inside, T, np.nan), np.where(P_absorbed <= 0, 0.0, np.nan))
     
+    def solve_sequence(self, P_absorbed, T_guess=300.0, rtol=1e-9, max_iter=50, strict=True):
+        """
+        Equilibrium temperatures of a sequence of absorbed powers, e.g. the
+        samples of a trajectory, see `solve_integral_sequence`: each solve
+        starts from the previous temperature and, with the analytic derivatives
+        of the integral, takes 2-3 evaluations when the power changes slowly.
+        The evaluations of every sample are kept in `self.evaluations`.
+
+        Args:
+            P_absorbed: array of absorbed powers, solved in C order
+            T_guess: starting temperature of the first sample
+            rtol: relative change of the temperature at convergence
+            max_iter: integral evaluations per sample before giving up
+            strict: raise when a sample does not converge, otherwise it is NaN
+
+        Returns:
+            temperatures, 0 where P_absorbed <= 0
+        """
+        P_absorbed = np.asarray(P_absorbed, dtype=np.float64)
+        T, self.evaluations = solve_integral_sequence(P_absorbed.ravel() / self.coeff, *self.quadrature,
+                                                      float(T_guess), rtol, max_iter)
+        failed = np.flatnonzero(np.isnan(T) & ~np.isnan(P_absorbed.ravel()))
+        if strict and len(failed):
+            raise RuntimeError(f"{len(failed)} of {T.size} temperatures did not converge in {max_iter} "
+                               f"evaluations, e.g. sample {failed[0]} (P={P_absorbed.ravel()[failed[0]]:.3e} W)")
+        return T.reshape(P_absorbed.shape)
+
     def residual_function(self, T, P_absorbed):
         """
         Compute residual: P_absorbed - 2πd² * ∫ ε(ω) * I(ω, T) dω
@@ -101,10 +350,17 @@ class EquilibriumSolver:
         if T <= 0:
             return P_absorbed  # Large positive residual for invalid T
         
-        rhs = self.coeff * compute_rhs_integral(T, self.frequencies, self.emissivities)
+        rhs = self.coeff * planck_sum(T, *self.quadrature)
         return P_absorbed - rhs
     
-    def solve_temperature(self, P_absorbed, T_guess=300.0, T_bounds=(1.0, 10000.0)):
+    def solve_temperature(self, P_absorbed, T_guess=300.0, T_bounds=(1.0, 10000.0), method="brentq"):
+        """
+        Equilibrium temperature of one absorbed power. With method="halley"
+        the solve of `solve_sequence` is used from T_guess, with no fixed
+        bracket, and a failure raises instead of returning T_guess.
+        """
+        if method == "halley":
+            return float(self.solve_sequence([P_absorbed], T_guess)[0])
         if P_absorbed <= 0:
             return 0.0
         try:
@@ -147,7 +403,7 @@ if __name__ == "__main__":
     frequencies2, reflectivity = load_emissivity_data('input/reflectivity/M1_f.csv')
     
     diameter = 10
-    solver = EquilibriumSolver(frequencies, emissivities, diameter)
+    solver = EquilibriumSolver.from_file('input/reflectivity/abs1_f.csv', diameter)
     
     freq = 282e12
     ee = interp1d(frequencies, emissivities, bounds_error=False,  fill_value=1e-6)
@@ -0,0 +1,87 @@
+import os
+import threading
+import numpy as np
+import pandas as pd
+from cache import hash_file
+from demo_equilibrium import compute_rhs_integrals, increasing_part, TABLE_FOLDER
+
+# frequency normalization of the emissivity in thermal.rs
+F0 = 2.819e14
+# quadrature of the solve_temperature call in main.rs
+FREQ_MIN = 1e9
+FREQ_MAX = 3e14
+N_POINTS = 100
+# temperature grid of the tables, spanning the bounds of the root finding in main.rs
+T_MIN = 1.0
+T_MAX = 5e4
+N_TABLE = 4096
+
+REFLECTIVITY = 'input/reflectivity/freq/'
+
+
+def linear_emissivity(filename):
+    """
+    Vectorized `linear_interpolator` of io.rs: linear, constant outside of the data.
+    """
+    data = pd.read_csv(filename)
+    data = data.sort_values(by=data.columns[0])
+    x, y = data.iloc[:, 0].to_numpy(np.float64), data.iloc[:, 1].to_numpy(np.float64)
+    return lambda f: np.interp(f, x, y)
+
+
+def step_emissivity(filename, threshold, fading):
+    """
+    Vectorized `step_interpolator` of io.rs: a0 above (1+fading)*threshold, a1
+    below (1-fading)*threshold, linear in between.
+    """
+    with open(filename) as f:
+        a0, a1 = (float(f.readline()) for _ in range(2))
+    low, high = (1 - fading) * threshold, (1 + fading) * threshold
+
+    def emissivity(f):
+        return np.where(f > high, a0, np.where(f < low, a1, (a0 * (f - low) + a1 * (high - f)) / (2 * fading * threshold)))
+    return emissivity
+
+
+def binary_emissivity(launch):
+    """
+    Emissivity file of the sail and its interpolator, following the selection
+    of `absor1_fun` in main.rs.
+
+    Returns:
+        (filename, name of the interpolation, vectorized emissivity of f/F0)
+    """
+    if launch.cutoff_frequency > 0.0:
+        filename = REFLECTIVITY + 'abs2_step_f.csv'
+        return filename, 'step', step_emissivity(filename, 0.2, 0.2)
+    filename = REFLECTIVITY + 'abs2_extended_f.csv'
+    return filename, 'linear', linear_emissivity(filename)
+
+
+def export_table(launch, folder=TABLE_FOLDER):
+    """
+    Emission curve (T, ∫ ε(ω) I(ω, T) dω) of the sail of `launch`, with the
+    emissivity and the quadrature of the binary, as a CSV file that the
+    binary inverts instead of solving for the temperature at every step (see
+    `solve_temperature_table` in thermal.rs). The file is keyed by the hash of
+    the emissivity file and built only when missing; since the emitted power
+    is 2πd² times the integral, it serves any sail diameter.
+
+    Returns:
+        path of the table
+    """
+    filename, kind, emissivity = binary_emissivity(launch)
+    key = hash_file(filename)
+    if not key:
+        raise FileNotFoundError(filename)
+    path = os.path.join(folder, f"binary_{kind}_{key[:16]}_{N_TABLE}.csv")
+    if os.path.exists(path):
+        return path
+    frequencies = np.exp(np.linspace(np.log(FREQ_MIN), np.log(FREQ_MAX), N_POINTS))
+    T = np.logspace(np.log10(T_MIN), np.log10(T_MAX), N_TABLE)
+    T, I = increasing_part(T, compute_rhs_integrals(T, frequencies, emissivity(frequencies / F0)))
+    os.makedirs(folder, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    pd.DataFrame({"T": T, "I": I}).to_csv(tmp, index=False, float_format="%.17g")
+    os.replace(tmp, path)
+    return path
@@ -1,6 +1,6 @@
 import subprocess
 import toml
-import os, sys
+import os
 import shutil
 
 import csv
@@ -12,8 +12,10 @@ import pandas as pd
 from scipy.constants import c
 import simulation
 from simulation import Reflector
+from sweep import Sweep, SweepResult
+from adaptive import refine_sweep
 from tqdm import tqdm
-from scipy.interpolate import interp1d
+from scipy.interpolate import PchipInterpolator
 
 figsize = (2.8, 2.2)
 plt.rcParams.update({
@@ -31,7 +33,9 @@ plt.rcParams.update({
 def plot_interstellar(todo = ["eta", "pow"],
                       override = False,
                       ratio = True,
-                      special = ""
+                      special = "",
+                      tol = 2e-3,
+                      budget = 25
                       ):
   if ratio: 
     assert not override 
@@ -88,34 +92,29 @@ def plot_interstellar(todo = ["eta", "pow"],
   ## ETA section ========================
   if "eta" in todo:
     n_samples_eta = 5
-    eta_range = np.linspace(0, 2, n_samples_eta, dtype=np.float64)
     eta_range_us = np.linspace(0, 2, n_samples_eta*50, dtype=np.float64)
     l = simulation.Launch()
+    l.use_cache()
+    l.use_catalog()
     l.p_0 = 50.0e9
     l.alpha1 = 0.0
+    if not os.path.exists("results/v_eta.npz") and os.path.exists("results/v_eta.npy") and not override:
+        # former format: bare array on a uniform grid, with the modes computed at the time
+        n_modes = np.load("results/v_eta.npy").shape[1]
+        legacy = Sweep({"eta": np.linspace(0, 2, n_samples_eta, dtype=np.float64)}, mode_range[:n_modes])
+        SweepResult.from_array("results/v_eta.npy", legacy).save("results/v_eta.npz")
     ## Compute section
-    if not os.path.exists("results/v_eta.npy") or override:
+    if not os.path.exists("results/v_eta.npz") or override:
         print("Computing...")
-        results_matrix = np.zeros(
-            (len(eta_range), len(mode_range)), dtype=np.float64)
+        assert(l.cutoff_frequency == 0.0)
+        result = refine_sweep(l, "eta", 0.0, 2.0, mode_range, log="results/v_eta.log",
+                              n_initial=n_samples_eta, tol=tol, budget=budget)
+        print(result.dims, np.shape(result.values))
+        result.save("results/v_eta.npz")
 
-        for (i, eta) in enumerate(eta_range):
-            for (j, mode) in enumerate(mode_range):
-                with open("input/_config.toml", "w") as config_file:
-                    l.eta = eta
-                    l.mode = mode[0]
-                    l.multilayer = mode[1]
-                    assert(l.cutoff_frequency == 0.0)
-                    print(f"eta={l.eta:.1e}, mode={str(mode[1]):15}", end="")
-                    print(f" | tf={l.get_tf():.3e}, ht = 1e-06")
-                    sys.stdout = open(os.devnull, 'w')
-                    l.write_config('input/_config.toml')
-                    results_matrix[i, j] = l.run()
-                    sys.stdout = sys.__stdout__
-        print(np.shape(results_matrix))
-        np.save("results/v_eta.npy", results_matrix)
-
-    results_matrix = np.load("results/v_eta.npy")
+    result = SweepResult.load("results/v_eta.npz")
+    eta_range = result.coords["eta"]
+    results_matrix = result.values
     print("Plotting...")
     print(np.shape(results_matrix))
     n_last_result = np.shape(results_matrix)[1]
@@ -126,7 +125,7 @@ def plot_interstellar(todo = ["eta", "pow"],
       for i in range(np.shape(results_matrix)[1]-1):
         results_matrix[:, i] = results_matrix[:, i] / results_matrix[:, n_last_result-1]
     # resampling
-    f = interp1d(eta_range, results_matrix, axis=0, kind='cubic', fill_value="extrapolate")
+    f = PchipInterpolator(eta_range, results_matrix, axis=0)
     results_matrix_us = f(eta_range_us)
     for (j, alpha) in enumerate(mode_range):
         plt.plot(eta_range_us, results_matrix_us[:, j],
@@ -159,33 +158,27 @@ def plot_interstellar(todo = ["eta", "pow"],
   ## POWER section =====================
   if "pow" in todo:
     n_samples_pow = 5
-    power_range = np.linspace(10, 100, n_samples_pow, dtype=np.float64) * 1e9
     power_range_us = np.linspace(10, 100, n_samples_pow*50, dtype=np.float64) * 1e9
     l = simulation.Launch()
+    l.use_cache()
+    l.use_catalog()
     l.eta = 0.0
-    if not os.path.exists("results/v_pow.npy") or override:
+    if not os.path.exists("results/v_pow.npz") and os.path.exists("results/v_pow.npy") and not override:
+        n_modes = np.load("results/v_pow.npy").shape[1]
+        legacy = Sweep({"p_0": np.linspace(10, 100, n_samples_pow, dtype=np.float64) * 1e9}, mode_range[:n_modes],
+                       fixed={"alpha1": 0.0})
+        SweepResult.from_array("results/v_pow.npy", legacy).save("results/v_pow.npz")
+    if not os.path.exists("results/v_pow.npz") or override:
         print("Computing...")
-        results_matrix = np.zeros(
-            (len(power_range), len(mode_range)), dtype=np.float64)
-
-        for (i, power) in enumerate(power_range):
-            for (j, mode) in enumerate(mode_range):
-                with open("input/_config.toml", "w") as config_file:
-                    l.p_0 = power
-                    l.mode = mode[0]
-                    l.multilayer = mode[1]
-                    l.alpha1 = 0.0 # enforce loading of actual reflectances
-                    # print(f"\n tf={l.get_tf():.3e}, ht = 1e-06")
-                    assert(l.cutoff_frequency == 0.0)
-                    print(f"pow={l.p_0:.1e}, mode={str(mode[1]):15}", end="")
-                    print(f" | tf={l.get_tf():.3e}, ht = 1e-06")
-                    sys.stdout = open(os.devnull, 'w')
-                    l.write_config('input/_config.toml')
-                    results_matrix[i, j] = l.run()
-                    sys.stdout = sys.__stdout__
-        np.save("results/v_pow.npy", results_matrix)
+        assert(l.cutoff_frequency == 0.0)
+        # alpha1 = 0 enforces loading of actual reflectances
+        result = refine_sweep(l, "p_0", 10e9, 100e9, mode_range, fixed={"alpha1": 0.0},
+                              log="results/v_pow.log", n_initial=n_samples_pow, tol=tol, budget=budget)
+        result.save("results/v_pow.npz")
 
-    results_matrix = np.load("results/v_pow.npy")
+    result = SweepResult.load("results/v_pow.npz")
+    power_range = result.coords["p_0"]
+    results_matrix = result.values
     print("Plotting...")
     if ratio:
       for i in range(np.shape(results_matrix)[1]-1):
@@ -194,7 +187,7 @@ def plot_interstellar(todo = ["eta", "pow"],
     plt.figure(figsize=figsize)
     np.set_printoptions(precision=10)
     # resampling 
-    f = interp1d(power_range, results_matrix, axis=0, kind='cubic', fill_value="extrapolate")
+    f = PchipInterpolator(power_range, results_matrix, axis=0)
     results_matrix_us = f(power_range_us)
     for (j, alpha) in enumerate(mode_range):
         plt.plot(power_range_us, results_matrix_us[:, j],
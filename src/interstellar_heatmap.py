@@ -1,6 +1,6 @@
 import subprocess
 import toml
-import os, sys
+import os
 import shutil
 
 import csv
@@ -12,6 +12,7 @@ import pandas as pd
 from scipy.constants import c
 import simulation
 from simulation import Reflector
+from sweep import Sweep, SweepResult
 from tqdm import tqdm
 from matplotlib.colors import LinearSegmentedColormap
 
@@ -63,30 +64,23 @@ def plot_interstellar_heatmap(override = False,
   eta_range = np.linspace(0, 2, 50, dtype=np.float64)
   power_range = np.linspace(10, 100, 25, dtype=np.float64) * 1e9
   l = simulation.Launch()
+  l.use_cache()
+  l.use_catalog()
   l.p_0 = 50.0e9
   l.alpha1 = 0.0
+  if not os.path.exists("results/v_heatmap.npz") and os.path.exists("results/v_heatmap.npy") and not override:
+      # former format: bare array, with the modes computed at the time
+      n_modes = np.load("results/v_heatmap.npy").shape[2]
+      legacy = Sweep({"p_0": power_range, "eta": eta_range}, mode_range[:n_modes])
+      SweepResult.from_array("results/v_heatmap.npy", legacy).save("results/v_heatmap.npz")
   ## Compute section
-  if not os.path.exists("results/v_eta.npy") or override:
+  if not os.path.exists("results/v_heatmap.npz") or override:
       print("Computing...")
-      results_matrix = np.zeros(
-          (len(power_range), len(eta_range), len(mode_range)), dtype=np.float64)
-      for (k, powr) in enumerate(power_range): 
-        for (i, eta) in enumerate(eta_range):
-            for (j, mode) in enumerate(mode_range):
-                l.eta = eta
-                l.p_0 = powr
-                l.mode = mode[0]
-                l.multilayer = mode[1]
-                print(f"eta={l.eta:.1e}, mode={str(mode[1]):15}", end="")
-                print(f" | tf={l.get_tf():.3e}, ht = 1e-06")
-                sys.stdout = open(os.devnull, 'w')
-                l.write_config('input/_config.toml')
-                results_matrix[k, i, j] = l.run()
-                sys.stdout = sys.__stdout__
-      print(np.shape(results_matrix))
-      np.save("results/v_heatmap.npy", results_matrix)
+      result = Sweep({"p_0": power_range, "eta": eta_range}, mode_range).run(l, log="results/v_heatmap.log")
+      print(result.dims, np.shape(result.values))
+      result.save("results/v_heatmap.npz")
 
-  results_matrix = np.load("results/v_heatmap.npy")
+  results_matrix = SweepResult.load("results/v_heatmap.npz").values
   
   print("Plotting heatmaps...")
   for j, mode in enumerate(mode_range):
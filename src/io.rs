@@ -2,7 +2,10 @@
 use csv::Writer;
 use std::path::Path;
 use std::error::Error;
+use std::fs::File;
+use std::io::{BufWriter, Write};
 use csv::ReaderBuilder;
+use crate::types::Checkpoint;
 pub fn save_results_to_csv(output: &Path, y: &Vec<(f64, f64, f64, f64, f64)>) {
   // Create a CSV writer
   let mut writer = Writer::from_path(output).expect("Failed to create a CSV Writer");
@@ -26,6 +29,103 @@ pub fn save_results_to_csv(output: &Path, y: &Vec<(f64, f64, f64, f64, f64)>) {
   writer.flush().expect("Failed to write the buffer");
 }
 
+/*
+Saves the results as a NumPy .npy file of shape (steps, 5), in column-major order
+so that every column (Time, q, Q, P, T) is contiguous and can be memory-mapped.
+*/
+pub fn save_results_to_npy(output: &Path, y: &Vec<(f64, f64, f64, f64, f64)>) {
+  let file = File::create(output).expect("Failed to create the npy file");
+  let mut writer = BufWriter::new(file);
+  let steps = y.len();
+
+  // header: magic, version 1.0, little-endian u16 length, dict padded to 64 bytes
+  let mut header = format!(
+    "{{'descr': '<f8', 'fortran_order': True, 'shape': ({}, 5), }}", steps);
+  let unpadded = 10 + header.len() + 1;
+  header.push_str(&" ".repeat((64 - unpadded % 64) % 64));
+  header.push('\n');
+  writer.write_all(b"\x93NUMPY\x01\x00").expect("Failed writing header");
+  writer.write_all(&(header.len() as u16).to_le_bytes()).expect("Failed writing header");
+  writer.write_all(header.as_bytes()).expect("Failed writing header");
+
+  let columns: [fn(&(f64, f64, f64, f64, f64)) -> f64; 5] =
+    [|r| r.0, |r| r.1, |r| r.2, |r| r.3, |r| r.4];
+  for column in columns.iter() {
+    for row in y.iter() {
+      writer.write_all(&column(row).to_le_bytes()).expect("Failed to write value");
+    }
+  }
+
+  // Flush the writer
+  writer.flush().expect("Failed to write the buffer");
+}
+
+/*
+Saves the state of a run as little-endian binary: the scalar state, the
+counts, then history, results and every power spectrum prefixed by its
+number of lines. Read back by load_checkpoint.
+*/
+pub fn save_checkpoint(output: &Path, c: &Checkpoint) {
+  let file = File::create(output).expect("Failed to create the checkpoint file");
+  let mut writer = BufWriter::new(file);
+  let mut words: Vec<[u8; 8]> = Vec::new();
+  for x in [c.t, c.q, c.q_prime, c.p, c.th, c.temperature, c.delta, c.status] {
+    words.push(x.to_le_bytes());
+  }
+  for n in [c.cnt, c.history.len(), c.results.len(), c.power_spectrum.len()] {
+    words.push((n as u64).to_le_bytes());
+  }
+  for word in words.iter() {
+    writer.write_all(word).expect("Failed to write checkpoint");
+  }
+  for h in c.history.iter() {
+    for x in [h.0, h.1, h.2, h.3] {
+      writer.write_all(&x.to_le_bytes()).expect("Failed to write checkpoint");
+    }
+  }
+  for r in c.results.iter() {
+    for x in [r.0, r.1, r.2, r.3, r.4] {
+      writer.write_all(&x.to_le_bytes()).expect("Failed to write checkpoint");
+    }
+  }
+  for spectrum in c.power_spectrum.iter() {
+    writer.write_all(&(spectrum.len() as u64).to_le_bytes()).expect("Failed to write checkpoint");
+    for line in spectrum.iter() {
+      writer.write_all(&line.0.to_le_bytes()).expect("Failed to write checkpoint");
+      writer.write_all(&line.1.to_le_bytes()).expect("Failed to write checkpoint");
+    }
+  }
+  writer.flush().expect("Failed to write the buffer");
+}
+
+pub fn load_checkpoint(path: &Path) -> Checkpoint {
+  let bytes = std::fs::read(path).expect("Failed to read the checkpoint file");
+  let mut offset = 0;
+  let mut word = || {
+    let chunk: [u8; 8] = bytes[offset..offset + 8].try_into().expect("Truncated checkpoint");
+    offset += 8;
+    chunk
+  };
+  let mut c = Checkpoint {
+    t: 0.0, q: 0.0, q_prime: 0.0, p: 0.0, th: 0.0, temperature: 0.0, delta: 0.0, status: 0.0,
+    cnt: 0, history: Vec::new(), results: Vec::new(), power_spectrum: Vec::new(),
+  };
+  let scalars: Vec<f64> = (0..8).map(|_| f64::from_le_bytes(word())).collect();
+  (c.t, c.q, c.q_prime, c.p, c.th, c.temperature, c.delta, c.status) =
+    (scalars[0], scalars[1], scalars[2], scalars[3], scalars[4], scalars[5], scalars[6], scalars[7]);
+  let counts: Vec<usize> = (0..4).map(|_| u64::from_le_bytes(word()) as usize).collect();
+  c.cnt = counts[0];
+  let mut f = || f64::from_le_bytes(word());
+  c.history = (0..counts[1]).map(|_| (f(), f(), f(), f())).collect();
+  c.results = (0..counts[2]).map(|_| (f(), f(), f(), f(), f())).collect();
+  drop(f);
+  for _ in 0..counts[3] {
+    let n = u64::from_le_bytes(word()) as usize;
+    c.power_spectrum.push((0..n).map(|_| (f64::from_le_bytes(word()), f64::from_le_bytes(word()))).collect());
+  }
+  c
+}
+
 pub fn save_spectrum_to_csv(output: &Path, y: &(Vec<f64>, Vec<Vec<f64>>)) {
   // Create a CSV writer
   let mut writer = Writer::from_path(output).expect("Failed to create a CSV Writer");
@@ -101,6 +201,20 @@ fn read_reflectivity_from_csv(file_path: &str) -> Result<Vec<DataPoint>, Box<dyn
 }
 
 
+/*
+Reads a tabulated emission curve (T, integral of the emissivity times the
+Planck spectrum), which must be strictly increasing in both columns.
+*/
+pub fn read_emission_table(file_path: &str) -> Result<Vec<DataPoint>, Box<dyn Error>> {
+    let table = read_reflectivity_from_csv(file_path)?;
+    if table.len() < 2 {
+        return Err("The emission table must contain at least 2 points".into());
+    }
+    if table.windows(2).any(|w| !(w[0].0 < w[1].0 && w[0].1 < w[1].1)) {
+        return Err("The emission table is not strictly increasing".into());
+    }
+    Ok(table)
+}
 
 pub fn linear_interpolator(file_path: &str) -> Result<Box<dyn Fn(f64) -> f64>, Box<dyn Error>> {
   let data_points = read_reflectivity_from_csv(file_path)?;
@@ -0,0 +1,303 @@
+import os
+import sys
+import json
+import time
+import socket
+import sqlite3
+import argparse
+import threading
+import contextlib
+import numpy as np
+from simulation import Launch, Reflector
+from sweep import SweepResult, cell_key
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sweeps (
+    name   TEXT PRIMARY KEY,
+    base   TEXT NOT NULL,  -- attributes of the base Launch
+    dims   TEXT NOT NULL,
+    coords TEXT NOT NULL,
+    shape  TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    sweep       TEXT NOT NULL,
+    idx         INTEGER NOT NULL,  -- C-order index of the cell in the result
+    key         TEXT NOT NULL,
+    override    TEXT NOT NULL,
+    state       TEXT NOT NULL DEFAULT 'pending',  -- pending, running, done, failed
+    worker      TEXT,
+    lease_until REAL,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    velocity    REAL,
+    error       TEXT,
+    PRIMARY KEY (sweep, idx)
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, lease_until);
+"""
+
+
+def encode(value):
+    if isinstance(value, Reflector):
+        return {"Reflector": value.name}
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def decode(value):
+    if isinstance(value, dict) and set(value) == {"Reflector"}:
+        return Reflector[value["Reflector"]]
+    return value
+
+
+def dumps(attributes):
+    return json.dumps({k: encode(v) for (k, v) in attributes.items()}, sort_keys=True)
+
+
+def loads(text):
+    return {k: decode(v) for (k, v) in json.loads(text).items()}
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobQueue:
+    """
+    Work queue of sweep cells in a SQLite database on a shared filesystem.
+    A sweep is enqueued once; any number of workers, on any host that sees the
+    database, claim cells under a lease, run them and commit the velocities.
+    A cell whose lease expires (its worker died) is claimed again, up to
+    `max_attempts` times. SQLite relies on the filesystem's locks, which NFS
+    v4 provides; the rollback journal is used since WAL does not work on NFS.
+
+    Args:
+        path: database file
+        lease: seconds a claimed cell stays reserved without renewal
+        max_attempts: claims of a cell before it is marked failed
+    """
+    def __init__(self, path, lease=600.0, max_attempts=3):
+        self.path = path
+        self.lease = lease
+        self.max_attempts = max_attempts
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        db = sqlite3.connect(path, timeout=60)
+        try:
+            db.executescript(SCHEMA)
+        finally:
+            db.close()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        # a fresh connection each time, so that the queue can be used from any thread
+        db = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+        finally:
+            db.close()
+
+    def enqueue(self, name, sweep, launch):
+        """
+        Add the cells of a `sweep.Sweep` run on `launch`; enqueuing the same
+        sweep again keeps the cells already there and their results, unless
+        their configuration changed (e.g. another base launch): those are reset
+        to pending, and the results of their runs in progress are dropped.
+
+        Returns:
+            number of cells reset
+        """
+        base = launch.parameters()
+        coords = {d: [encode(x) for x in np.asarray(v).tolist()] for (d, v) in sweep.coords.items()}
+        cells = [(i, cell_key(launch, cell), dumps(cell)) for (i, cell) in enumerate(sweep.cells())]
+        with self.transaction() as db:
+            db.execute("INSERT OR REPLACE INTO sweeps VALUES (?, ?, ?, ?, ?)",
+                       (name, dumps(base), json.dumps(sweep.dims), json.dumps(coords),
+                        json.dumps(sweep.shape)))
+            existing = dict(db.execute("SELECT idx, key FROM jobs WHERE sweep = ?", (name,)).fetchall())
+            changed = [(key, override, name, i) for (i, key, override) in cells
+                       if i in existing and existing[i] != key]
+            db.executemany("UPDATE jobs SET key = ?, override = ?, state = 'pending', worker = NULL, "
+                           "lease_until = NULL, attempts = 0, velocity = NULL, error = NULL "
+                           "WHERE sweep = ? AND idx = ?", changed)
+            db.executemany("INSERT OR IGNORE INTO jobs (sweep, idx, key, override) VALUES (?, ?, ?, ?)",
+                           [(name, i, key, override) for (i, key, override) in cells])
+            db.execute("DELETE FROM jobs WHERE sweep = ? AND idx >= ?", (name, len(cells)))
+        return len(changed)
+
+    def base_launch(self, name, filename='input/_params.toml'):
+        """
+        Launch with the attributes the sweep was enqueued with.
+        """
+        with self.transaction() as db:
+            (base,) = db.execute("SELECT base FROM sweeps WHERE name = ?", (name,)).fetchone()
+        launch = Launch(filename)
+        for (key, value) in loads(base).items():
+            setattr(launch, key, value)
+        return launch
+
+    def claim(self, worker, n=1, name=None):
+        """
+        Reserve up to `n` cells that are pending or whose lease expired.
+
+        Returns:
+            list of (sweep, idx, override, key)
+        """
+        now = time.time()
+        query = ("SELECT sweep, idx, override, key FROM jobs WHERE attempts < ? AND "
+                 "(state = 'pending' OR (state = 'running' AND lease_until < ?))")
+        args = [self.max_attempts, now]
+        if name is not None:
+            query += " AND sweep = ?"
+            args.append(name)
+        query += " ORDER BY sweep, idx LIMIT ?"
+        args.append(n)
+        with self.transaction() as db:
+            jobs = db.execute(query, args).fetchall()
+            db.executemany("UPDATE jobs SET state = 'running', worker = ?, lease_until = ?, "
+                           "attempts = attempts + 1 WHERE sweep = ? AND idx = ?",
+                           [(worker, now + self.lease, sweep, idx) for (sweep, idx, _, _) in jobs])
+            # cells that died with their workers too many times
+            db.execute("UPDATE jobs SET state = 'failed', error = 'lease expired' WHERE "
+                       "state = 'running' AND lease_until < ? AND attempts >= ?",
+                       (now, self.max_attempts))
+        return [(sweep, idx, loads(override), key) for (sweep, idx, override, key) in jobs]
+
+    def renew(self, worker, jobs):
+        """
+        Extend the leases of the cells `worker` still holds.
+        """
+        with self.transaction() as db:
+            db.executemany("UPDATE jobs SET lease_until = ? WHERE sweep = ? AND idx = ? "
+                           "AND worker = ? AND state = 'running'",
+                           [(time.time() + self.lease, sweep, idx, worker) for (sweep, idx, _, _) in jobs])
+
+    def complete(self, sweep, idx, key, velocity):
+        """
+        Commit the velocity of a cell, even if its lease was lost meanwhile:
+        a cell always gives the same result. Ignored if the cell was enqueued
+        again with another configuration (`key`) in the meantime.
+        """
+        with self.transaction() as db:
+            db.execute("UPDATE jobs SET state = 'done', velocity = ?, error = NULL "
+                       "WHERE sweep = ? AND idx = ? AND key = ? AND state != 'done'",
+                       (velocity, sweep, idx, key))
+
+    def fail(self, sweep, idx, key, error):
+        """
+        Give a failed cell back to the queue, or mark it failed after `max_attempts`.
+        """
+        with self.transaction() as db:
+            db.execute("UPDATE jobs SET state = CASE WHEN attempts < ? THEN 'pending' ELSE 'failed' END, "
+                       "error = ? WHERE sweep = ? AND idx = ? AND key = ? AND state = 'running'",
+                       (self.max_attempts, error, sweep, idx, key))
+
+    def status(self, name=None):
+        """
+        Number of cells by state.
+        """
+        query = "SELECT state, COUNT(*) FROM jobs"
+        args = ()
+        if name is not None:
+            query += " WHERE sweep = ?"
+            args = (name,)
+        with self.transaction() as db:
+            return dict(db.execute(query + " GROUP BY state", args).fetchall())
+
+    def result(self, name):
+        """
+        SweepResult of a sweep, NaN for the cells not done.
+        """
+        with self.transaction() as db:
+            dims, coords, shape = db.execute("SELECT dims, coords, shape FROM sweeps WHERE name = ?",
+                                             (name,)).fetchone()
+            done = db.execute("SELECT idx, velocity FROM jobs WHERE sweep = ? AND state = 'done'",
+                              (name,)).fetchall()
+        values = np.full(int(np.prod(json.loads(shape))), np.nan)
+        for (idx, velocity) in done:
+            values[idx] = velocity
+        coords = {d: np.array(v) for (d, v) in json.loads(coords).items()}
+        return SweepResult(values.reshape(json.loads(shape)), json.loads(dims), coords)
+
+    def work(self, name=None, workers=None, batch=None, cache=False, wait=False, poll=10.0,
+             params='input/_params.toml'):
+        """
+        Worker loop: claim cells, run them with `Launch.run_many` on the base
+        launch of their sweep and commit each velocity as soon as it is known,
+        renewing the leases meanwhile. Several workers can run on every host.
+
+        Args:
+            name: only work on this sweep
+            workers: simultaneous runs of this worker, see `Launch.run_many`
+            batch: cells claimed at a time, 2 * workers by default
+            cache: serve the runs from the result cache of each base launch
+            wait: when nothing can be claimed, keep polling every `poll`
+                  seconds until no cell is running elsewhere
+            params: params file of the base launches on this host
+        """
+        worker = worker_name()
+        batch = batch or 2 * (workers or os.cpu_count() or 1)
+        launches = {}
+        while True:
+            jobs = self.claim(worker, batch, name)
+            if not jobs:
+                status = self.status(name)
+                if wait and status.get('running', 0) + status.get('pending', 0) > 0:
+                    time.sleep(poll)
+                    continue
+                return
+            stop = threading.Event()
+
+            def heartbeat():
+                while not stop.wait(self.lease / 3):
+                    self.renew(worker, jobs)
+
+            renewer = threading.Thread(target=heartbeat, daemon=True)
+            renewer.start()
+            try:
+                for sweep in sorted({sweep for (sweep, _, _, _) in jobs}):
+                    mine = [(idx, override, key) for (s, idx, override, key) in jobs if s == sweep]
+                    # the sweep may have been enqueued again with another base launch
+                    if sweep not in launches or any(cell_key(launches[sweep], override) != key
+                                                    for (_, override, key) in mine):
+                        launches[sweep] = self.base_launch(sweep, params)
+                        if cache:
+                            launches[sweep].use_cache()
+
+                    def commit(i, velocity):
+                        (idx, _, key) = mine[i]
+                        if np.isnan(velocity):
+                            self.fail(sweep, idx, key, "run failed")
+                        else:
+                            self.complete(sweep, idx, key, float(velocity))
+
+                    launches[sweep].run_many([override for (_, override, _) in mine], workers=workers,
+                                             progress=False, on_result=commit)
+            finally:
+                stop.set()
+                renewer.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Worker of a shared sweep queue")
+    parser.add_argument("command", choices=["work", "status"])
+    parser.add_argument("database")
+    parser.add_argument("--sweep", default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--lease", type=float, default=600.0)
+    parser.add_argument("--cache", action="store_true")
+    parser.add_argument("--wait", action="store_true")
+    parser.add_argument("--params", default="input/_params.toml")
+    args = parser.parse_args()
+
+    queue = JobQueue(args.database, lease=args.lease)
+    if args.command == "work":
+        queue.work(args.sweep, args.workers, cache=args.cache, wait=args.wait, params=args.params)
+    print(queue.status(args.sweep), file=sys.stderr)
@@ -0,0 +1,67 @@
+import numpy as np
+
+HT = 0.000001  # time step, as in solver.rs
+
+
+def h_dydt(Q, p, ht):
+    """
+    Increment of (q, Q) over a step `ht`, the relativistic equation of h_dydt in solver.rs.
+    """
+    return ht * Q, ht * 2.0 * p * (1.0 - Q**2)**1.5 * (1.0 - Q) / (1.0 + Q)
+
+
+def integrate(q, Q, p, tf, ht=HT, record_every=None):
+    """
+    Integrate the no-delay (lubin) dynamics of many configurations at once
+    with RK4, with the same stopping rules as main.rs: a configuration stops
+    at t >= tf or when its velocity no longer increases.
+
+    Args:
+        q, Q: initial normalized position and velocity, arrays of shape (n,)
+        p: effective normalized power p/(1 - alpha1*alpha2), shape (n,)
+        tf: normalized final times, shape (n,)
+        ht: time step
+        record_every: keep one trajectory sample every `record_every` steps
+
+    Returns:
+        final velocities of shape (n,) and, if `record_every` is given, the
+        decimated trajectory as a dict of Time (steps,) and q, Q (steps, n)
+    """
+    q, Q, p, tf = np.broadcast_arrays(*(np.array(a, dtype=np.float64) for a in (q, Q, p, tf)))
+    q, Q = q.copy(), Q.copy()
+    status = np.full_like(Q, -1.0)
+    t = 0.0
+    step = 0
+    trajectory = {"Time": [t], "q": [q.copy()], "Q": [Q.copy()]}
+    active = (t < tf) & (Q - status > 0.0)
+    while active.any():
+        status = np.where(active, Q, status)
+        k1 = h_dydt(Q, p, ht)
+        k2 = h_dydt(Q + 0.5 * k1[1], p, ht)
+        k3 = h_dydt(Q + 0.5 * k2[1], p, ht)
+        k4 = h_dydt(Q + k3[1], p, ht)
+        q = np.where(active, q + (k1[0] + 2.0 * k2[0] + 2.0 * k3[0] + k4[0]) / 6.0, q)
+        Q = np.where(active, Q + (k1[1] + 2.0 * k2[1] + 2.0 * k3[1] + k4[1]) / 6.0, Q)
+        t += ht
+        step += 1
+        if record_every is not None and step % record_every == 0:
+            trajectory["Time"].append(t)
+            trajectory["q"].append(q.copy())
+            trajectory["Q"].append(Q.copy())
+        active = (t < tf) & (Q - status > 0.0)
+
+    if record_every is None:
+        return Q
+    return Q, {key: np.array(value) for (key, value) in trajectory.items()}
+
+
+def integrate_configs(configs, ht=HT, record_every=None):
+    """
+    Integrate a list of normalized configs (as produced by `Launch.get_config`)
+    in lubin mode.
+    """
+    q = np.array([c["q"] for c in configs])
+    Q = np.array([c["q_prime"] for c in configs])
+    p = np.array([c["p"] / (1.0 - c["alpha1"] * c["alpha2"]) for c in configs])
+    tf = np.array([c["tf"] for c in configs])
+    return integrate(q, Q, p, tf, ht, record_every)
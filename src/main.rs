@@ -1,4 +1,4 @@
-use std::path::{PathBuf};
+use std::path::{Path, PathBuf};
 
 use log::Level;
 use simple_logger;
@@ -87,6 +87,9 @@ fn main() {
         alpha2_fun = constant_interpolator(alpha2).expect("Failed to build interpolator");
       }
     }
+    // tabulated emission curve of absor1_fun, interpolated instead of solving for the temperature
+    let emission_table = config.emission_table.as_ref()
+      .map(|path| read_emission_table(path).expect("Failed to read the emission table"));
 
 
     let mode = &config.mode;
@@ -96,11 +99,23 @@ fn main() {
     let mut diff_factor= 0.0;
 
     let alphart = alpha1*alpha2;
-    if mode == "lubin" {
-      p /= 1.0 - alphart;
+    if let Some(path) = &config.resume {
+      // continue a previous run with the same parameters: its whole state, including
+      // the history needed by the delay, is restored and the outputs are extended
+      let checkpoint = load_checkpoint(Path::new(path));
+      (t, q, q_prime, p, th, temperature, delta, status, cnt) = (checkpoint.t, checkpoint.q,
+        checkpoint.q_prime, checkpoint.p, checkpoint.th, checkpoint.temperature,
+        checkpoint.delta, checkpoint.status, checkpoint.cnt);
+      history = checkpoint.history;
+      results = checkpoint.results;
+      power_spectrum = checkpoint.power_spectrum;
+      println!("Resumed at t={:3.2e}", t);
+    } else {
+      if mode == "lubin" {
+        p /= 1.0 - alphart;
+      }
+      results.push((t, q, q_prime, th, temperature));
     }
-
-    results.push((t, q, q_prime, th, temperature));
     while (t < tf) && (q_prime - status > threshold){
         if mode == "delay" {
           if !(t==0.0) {
@@ -132,14 +147,17 @@ fn main() {
               th = tmp.1;
               
               if multilayer != "FLAT" {
-                temperature = solve_temperature(th * params.p_0,
-                  diameter,
-                  &absor1_fun, 
-                  1e9,
-                  3e14,
-                  Some(100),
-                  Some(1.0),
-                  Some((0.0, 50000.0))).unwrap_or(-1.0);
+                temperature = match &emission_table {
+                  Some(table) => solve_temperature_table(th * params.p_0, diameter, table),
+                  None => solve_temperature(th * params.p_0,
+                    diameter,
+                    &absor1_fun, 
+                    1e9,
+                    3e14,
+                    Some(100),
+                    Some(1.0),
+                    Some((0.0, 50000.0))),
+                }.unwrap_or(-1.0);
                 // for _i in 0..temperature_stepping_decimation {
                 //     temperature = step_temperature_euler(th * 50e9,
                 //       &absor1_fun, 
@@ -185,6 +203,13 @@ fn main() {
           temperature, 
           th);
         }
+        #[cfg(not(debug_assertions))]
+        {
+          // sparse progress line, one per percent of tf
+          if (t / tf * 100.0).floor() > ((t - HT) / tf * 100.0).floor() {
+            println!("t={:3.2e}", t);
+          }
+        }
         results.push((t, th, q_prime, p, temperature));
     }
     if t < tf {
@@ -194,7 +219,21 @@ fn main() {
     }
     // plot_results(&results).expect("Failed to plot results");
     output.push(&file);
-    save_results_to_csv(output.as_path(), &results);
+    if config.format.as_deref() == Some("npy") {
+      output.set_extension("npy");
+      save_results_to_npy(output.as_path(), &results);
+    } else {
+      save_results_to_csv(output.as_path(), &results);
+    }
+    if config.checkpoint == Some(true) {
+      // saved before the spectrum is padded for the csv
+      let checkpoint = Checkpoint { t, q, q_prime, p, th, temperature, delta, status, cnt,
+        history, results, power_spectrum };
+      let mut checkpoint_path = output.clone();
+      checkpoint_path.set_extension("ckpt");
+      save_checkpoint(checkpoint_path.as_path(), &checkpoint);
+      power_spectrum = checkpoint.power_spectrum;
+    }
     
     if mode=="delay"
     {
@@ -1,4 +1,3 @@
-import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
 import toml
@@ -18,6 +17,8 @@ l.alpha2 = 1.0
 l.mode = "delay"
 l.p_0 = 50e9
 l.t_f = 500
+l.use_workspace('plotter_compare')
+l.output_format = 'npy'
 # 3e6 for short, 3e9 for long
 
 for q_0_type in ["short", "long"]:
@@ -44,9 +45,9 @@ for q_0_type in ["short", "long"]:
       if compute:
         print(f">> Running with alpha1 = {alpha2} and mode = {mode}")
         l.alpha2 = alpha2
-        l.write_config('input/_config.toml')
+        l.write_config()
         l.run()
-      dd = pd.read_csv('results/'+l.file)
+      dd = l.read_trajectory()
       df_list.append(dd)
       P_list.append(dd['P'])
       q_list.append(dd['q'])
@@ -60,7 +61,7 @@ for q_0_type in ["short", "long"]:
   l.mode = "lubin"
   l.alpha2 = 0.0
   l.file = 'power0.00_lubin.csv'
-  l.write_config('input/_config.toml')
+  l.write_config()
   if True:
     print(f"Lubin S and mode={l.mode}")
     l.run()
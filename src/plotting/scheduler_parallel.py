@@ -1,7 +1,9 @@
 import subprocess
 import toml
 import os
+import sys
 import shutil
+import threading
 
 import csv
 import numpy as np
@@ -10,7 +12,9 @@ from matplotlib.ticker import MaxNLocator
 import seaborn as sns
 import pandas as pd
 
-from concurrent.futures import ProcessPoolExecutor, as_completed
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from scheduling import Scheduler
+from simulation import stop_process
 
 p1_range = np.linspace(0.001, 1.0, 4)  # percent of the lower frequency laser
 p2_range = np.linspace(0.0, 1.0, 4)  # reflectivity
@@ -42,41 +46,51 @@ for (i, p1) in enumerate(p1_range):
 rust_program = "./target/release/photopropulsion"
 print("Running the Rust program in ", rust_program)
 
-def run_simulation(i, j, config):
-    config_file_path = f"input/config_{i}_{j}.toml"
+def config_path(task):
+    i, j, _ = task
+    return f"input/config_{i}_{j}.toml"
 
+def run_simulation(task, timeout, cancel):
+    config_file_path = config_path(task)
     with open(config_file_path, "w") as config_file:
-        toml.dump(config, config_file)
-
-    result = subprocess.run(
-        [rust_program, config_file_path], capture_output=True, text=True)
-
-    output = result.stdout.strip()
+        toml.dump(task[2], config_file)
+
+    # the child is killed past the timeout, or when the scheduler is interrupted
+    process = subprocess.Popen(
+        [rust_program, config_file_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    killed = []
+    watchdog = threading.Thread(target=stop_process, args=(process, timeout, cancel, killed), daemon=True)
+    watchdog.start()
+    stdout, _ = process.communicate()
+    watchdog.join()
+    if killed:
+        # raises, so that a run past the timeout is retried by the scheduler
+        raise RuntimeError(f"run {killed[0]}")
+
+    output = stdout.strip()
     lines = output.splitlines()
-    print(lines[-2])
-    last_line = lines[-1].strip()
+    if len(lines) > 1:
+        print(lines[-2])
+    last_line = lines[-1].strip() if lines else ""
 
     try:
-        result_float = float(last_line)
-        return i, j, result_float
+        return float(last_line)
     except ValueError as e:
         print(f"Failed to convert the last line to float: {e}")
-        return i, j, None
+        return None
 
 
 tasks = [(i, j, configurations[i][j]) for i in range(len(p1_range))
          for j in range(len(p2_range))]
 
-num_workers = max(1, os.cpu_count() - 12)
-with ProcessPoolExecutor(max_workers=num_workers) as executor:
-    futures = [executor.submit(run_simulation, i, j, config)
-               for (i, j, config) in tasks]
-
-    for future in as_completed(futures):
-        i, j, result_float = future.result()
-        if result_float is not None:
-            print(result_float)
-            results_matrix[i, j] = result_float
+# the runs far from the reflector last longer, they are started first
+scheduler = Scheduler(timeout=3600, retries=1)
+results = scheduler.map(run_simulation, tasks, cost=lambda task: task[2]["q"],
+                        scratch=lambda task: [config_path(task)])
+for ((i, j, _), result_float) in zip(tasks, results):
+    if result_float is not None:
+        print(result_float)
+        results_matrix[i, j] = result_float
 
 # Plotting
 df = pd.DataFrame(results_matrix, index=p1_range, columns=p2_range)
@@ -0,0 +1,151 @@
+import os
+import sys
+import shutil
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from tqdm import tqdm
+
+
+def available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def available_memory():
+    """
+    Physical memory currently available in bytes, None where it cannot be read.
+    """
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def default_workers(memory_per_task=None):
+    """
+    One worker per available core, fewer if `memory_per_task` bytes each would
+    not fit in the available memory.
+    """
+    workers = available_cores()
+    memory = available_memory()
+    if memory_per_task and memory is not None:
+        workers = min(workers, int(memory // memory_per_task))
+    return max(1, workers)
+
+
+def failed(result):
+    """
+    Default failure test of a task result: None or NaN.
+    """
+    return result is None or (isinstance(result, float) and np.isnan(result))
+
+
+def remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class Scheduler:
+    """
+    Runs many independent tasks concurrently. The tasks are expected to do
+    their work in child processes (e.g. `Launch.run`), so they are run by a
+    thread pool. A task that raises or returns a failed result is retried a
+    bounded number of times, and never takes the other results down with it.
+
+    Args:
+        workers: simultaneous tasks, see `default_workers` when None
+        memory_per_task: expected peak memory of a task in bytes, bounds the default workers
+        timeout: wall-clock limit of every task in seconds, passed to the tasks
+        retries: additional attempts of a failed task
+        progress: show a progress bar on stderr
+        failed: callable telling whether a result is a failure
+    """
+    def __init__(self, workers=None, memory_per_task=None, timeout=None, retries=0,
+                 progress=True, failed=failed):
+        self.workers = default_workers(memory_per_task) if workers is None else max(1, workers)
+        self.timeout = timeout
+        self.retries = retries
+        self.progress = progress
+        self.failed = failed
+        self.errors = {}  # index -> exception (or None for a failed result) of the last map
+
+    def map(self, fn, items, cost=None, scratch=None, on_result=None):
+        """
+        Run fn(item, timeout, cancel) for every item, where `cancel` is a
+        threading.Event set when the whole map is interrupted (e.g. Ctrl-C).
+
+        Args:
+            fn: the task; it must honour `timeout` and `cancel` itself, by
+                killing its child process
+            items: task arguments
+            cost: callable(item) giving the expected duration, the longest
+                  tasks are started first so that they do not end up last
+            scratch: callable(item) giving the scratch files and folders of a
+                     task, removed after every attempt
+            on_result: callback(index, result) called as soon as a task is final
+
+        Returns:
+            list of results in the order of `items`; the failed tasks keep their
+            last result, None if it raised, and are listed in `self.errors`
+        """
+        items = list(items)
+        results = [None] * len(items)
+        attempts = [0] * len(items)
+        self.errors = {}
+        order = range(len(items))
+        if cost is not None:
+            order = sorted(order, key=lambda i: -cost(items[i]))
+        cancel = threading.Event()
+
+        def attempt(i):
+            try:
+                return fn(items[i], self.timeout, cancel)
+            finally:
+                if scratch is not None:
+                    for path in scratch(items[i]):
+                        remove(path)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor, \
+             tqdm(total=len(items), disable=not self.progress, file=sys.stderr) as bar:
+            pending = {executor.submit(attempt, i): i for i in order}
+            try:
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        i = pending.pop(future)
+                        attempts[i] += 1
+                        error = None
+                        try:
+                            results[i] = future.result()
+                            bad = self.failed(results[i])
+                        except Exception as e:
+                            results[i] = None
+                            error = e
+                            bad = True
+                        if bad and attempts[i] <= self.retries and not cancel.is_set():
+                            pending[executor.submit(attempt, i)] = i
+                            continue
+                        if bad:
+                            self.errors[i] = error
+                        bar.update()
+                        if on_result is not None:
+                            on_result(i, results[i])
+            except BaseException:
+                # drop the queued tasks and make the running ones kill their children
+                for future in pending:
+                    future.cancel()
+                cancel.set()
+                raise
+        if self.errors:
+            first = next(iter(self.errors.items()))
+            print(f"{len(self.errors)} of {len(items)} tasks failed, e.g. task {first[0]}: {first[1]!r}",
+                  file=sys.stderr)
+        return results
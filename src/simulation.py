@@ -2,10 +2,26 @@ import numpy as np
 from dataclasses import dataclass
 import toml
 import subprocess
+import os
+import copy
+import glob
+import re
+import time
+import shutil
+import threading
+import tempfile
+import contextlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from cache import RunCache
+from catalog import Catalog
+from scheduling import Scheduler
+import build
+import decimate
+import lubin
 import pandas as pd
 import matplotlib.pyplot as plt
 from enum import Enum
-import csv
 import matplotlib.colors as mcolors
 from matplotlib.cm import get_cmap
 from matplotlib.collections import LineCollection
@@ -14,6 +30,56 @@ from scipy.constants import lambda2nu, Boltzmann, c, h
 from matplotlib.colors import LinearSegmentedColormap
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 from matplotlib.colorbar import Colorbar
+from matplotlib.figure import Figure
+
+# per-run state of a Launch, not part of the parameters of a run
+LOCAL_ATTRIBUTES = ("workspace", "temporary_workspace", "cache", "catalog", "termination",
+                    "config_path", "output_folder", "resume_from")
+
+# columns of the trajectory files written by the binary
+TRAJECTORY_COLUMNS = ('Time', 'q', 'Q', 'P', 'T')
+
+# progress lines printed by the binary, e.g. "t=1.00e-2|tau=..." or "t=1.00e-2"
+PROGRESS_LINE = re.compile(r'^t=\s*([-+0-9.eE]+)')
+
+def stop_process(process, timeout, cancel, killed):
+    """
+    Kill `process` when `cancel` is set or after `timeout` seconds, recording
+    the reason in the `killed` list. Returns as soon as the process exits.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while process.poll() is None:
+        if cancel is not None and cancel.is_set():
+            reason = "cancelled"
+        elif deadline is not None and time.monotonic() > deadline:
+            reason = "timed out"
+        else:
+            time.sleep(0.05)
+            continue
+        killed.append(reason)
+        process.terminate()
+        try:
+            process.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        return
+
+def save_panel(name, x, y, color, label, ylabel, hline, grid, lw):
+    """
+    Save a single time series panel of `Launch.plot_dynamics`. A standalone
+    Figure is not tracked by pyplot, so nothing leaks across calls.
+    """
+    fig = Figure(figsize=(3, 2.5))
+    ax = fig.add_subplot()
+    ax.plot(x, y, linestyle='-', color=color, label=label, linewidth=lw)
+    ax.set_xlabel(r'$t/t_{\mathrm{rel}}$')
+    ax.set_ylabel(ylabel)
+    ax.grid(grid)
+    if hline is not None:
+        ax.axhline(hline, ls="--", color="r", lw=1)
+    fig.tight_layout()
+    fig.savefig(name)  # Save plot as PDF for LaTeX
+    return name
 
 def adjust_luminosity_contrast(cmap, lum_factor, contrast_factor):
     colors = cmap(np.arange(cmap.N))
@@ -65,7 +131,17 @@ class Launch:
         self.d_sail = 2 * np.sqrt(self.sail_mass/self.sigma/np.pi)
         self.alpha = 1.22
         self.file = 'delay.csv'
+        self.output_format = 'csv'  # 'npy' for a memory-mappable trajectory
         self.output_folder = 'results/'
+        self.config_path = 'input/_config.toml'
+        self.workspace = None
+        self.temporary_workspace = False
+        self.cache = None
+        self.catalog = None
+        self.termination = None  # how the last run ended
+        self.checkpoint = False  # save a restartable state at the end of every run
+        self.resume_from = None  # checkpoint the next run continues from
+        self.emission_tables = None  # folder of the emission tables the binary inverts for the temperature
 
     def get_m(self):
         return (1 + self.eta) * self.sail_mass
@@ -92,16 +168,135 @@ class Launch:
         self.compile()
         self.run()
 
-    def compile(self):
-        rust_compile = 'cargo build --release'
+    def compile(self, force=False):
+        """
+        Build the binary with cargo, unless the sources, the manifest and the
+        binary are the same as at the last build. Raises RuntimeError on failure.
+        """
+        if not force and build.is_up_to_date(self.rust):
+            print("Binary is up to date.")
+            return
         print("Compiling...")
-        result = subprocess.run(rust_compile, shell=True,
-                                capture_output=True, text=True)
+        build.build(self.rust)
         # print("Done.")
 
-    def write_config(self, file):
-        print("Wrinting config...")
-
+    def use_workspace(self, name=None, root='results/runs/'):
+        """
+        Isolate the next runs in their own directory: the config is written
+        there, passed to the binary, and all the outputs (trajectory and
+        spectrum) are collected from there.
+
+        Args:
+            name: workspace name under `root`; a temporary directory is
+                  created when None
+            root: parent folder of the workspaces
+
+        Returns:
+            the workspace path
+        """
+        self.release_workspace()
+        os.makedirs(root, exist_ok=True)
+        if name is None:
+            path = tempfile.mkdtemp(prefix='run_', dir=root)
+        else:
+            path = os.path.join(root, name)
+            os.makedirs(path, exist_ok=True)
+        self.workspace = path
+        self.temporary_workspace = name is None
+        self.output_folder = os.path.join(path, '')
+        self.config_path = os.path.join(path, '_config.toml')
+        return path
+
+    def release_workspace(self):
+        """
+        Go back to the shared `input/` and `results/` folders, deleting the
+        workspace if it was a temporary one.
+        """
+        if self.workspace is None:
+            return
+        if self.temporary_workspace:
+            shutil.rmtree(self.workspace, ignore_errors=True)
+        self.workspace = None
+        self.temporary_workspace = False
+        self.output_folder = 'results/'
+        self.config_path = 'input/_config.toml'
+
+    def use_cache(self, folder='results/cache/', max_size=20e9):
+        """
+        Serve repeated runs from a content-addressed result cache, see `cache.RunCache`.
+        """
+        self.cache = RunCache(folder, max_size)
+        return self.cache
+
+    def use_catalog(self, folder='results/catalog/', keep_outputs=False, summarize=False):
+        """
+        Record every run in a queryable catalog, see `catalog.Catalog`.
+        """
+        self.catalog = Catalog(folder, keep_outputs, summarize)
+        return self.catalog
+
+    def use_emission_tables(self, folder='results/emission/'):
+        """
+        Have the binary interpolate the sail temperature on a stored emission
+        curve instead of solving for it at every step, see `emission.export_table`.
+        """
+        self.emission_tables = folder
+
+    def emission_table(self):
+        """
+        Emission table of the current parameters, built when missing.
+        """
+        import emission
+        return emission.export_table(self, self.emission_tables)
+
+    def parameters(self):
+        """
+        Attributes defining a run, without the per-run state (workspace, cache, ...).
+        """
+        return {k: v for (k, v) in vars(self).items() if k not in LOCAL_ATTRIBUTES}
+
+    def input_files(self):
+        """
+        Data files the binary reads for the current parameters, following the
+        interpolator selection in main.rs. In lubin mode the power is constant
+        and they do not affect the results.
+        """
+        if self.mode != "delay":
+            return [] if self.resume_from is None else [self.resume_from]
+        folder = 'input/reflectivity/freq/'
+        if self.cutoff_frequency > 0.0:
+            files = ['abs2_step_f.csv', 'S_step_f.csv', 'DE_step_f.csv']
+        else:
+            files = ['abs2_extended_f.csv']
+            if self.alpha1 == 0.0:
+                files.append(self.multilayer.name + '_f.csv')
+                files.append('FLAT_f.csv' if self.multilayer == Reflector.FLAT else 'DE_f.csv')
+        # p_0 for the thermal section is read from the params file
+        files = [folder + f for f in files] + ['input/_params.toml']
+        if self.resume_from is not None:
+            files.append(self.resume_from)
+        if self.emission_tables is not None:
+            files.append(self.emission_table())
+        return files
+
+    def binary_fingerprint(self):
+        return build.binary_fingerprint(self.rust)
+
+    def outputs(self):
+        """
+        Output files of a run, by role.
+        """
+        outputs = {"trajectory": self.trajectory_path()}
+        if self.mode == "delay":
+            outputs["spectrum"] = self.output_folder + 'spectrum.csv'
+        if self.checkpoint:
+            outputs["checkpoint"] = self.checkpoint_path()
+        return outputs
+
+    def get_config(self):
+        """
+        Normalized parameters passed to the binary.
+        """
         config = {
             "q":             float(self.q_0/self.get_l_rel()),
             "q_prime":       0.0,
@@ -116,41 +311,259 @@ class Launch:
             "diffraction_constant": float(self.get_d_c()),
             "sail_diameter": float(self.d_sail),
             "file":          self.file,
+            "format":        self.output_format,
             "mode":          self.mode,
             "output":        self.output_folder
         }
+        # only when enabled, so that the other configs (and their cache keys) are unchanged
+        if self.checkpoint:
+            config["checkpoint"] = True
+        if self.resume_from is not None:
+            config["resume"] = self.resume_from
+        if self.emission_tables is not None and self.mode == "delay":
+            config["emission_table"] = self.emission_table()
+        return config
+
+    def write_config(self, file=None, quiet=False):
+        if not quiet:
+            print("Wrinting config...")
+        if file is None:
+            file = self.config_path
+        self.config_path = file
+
+        config = self.get_config()
         with open(file, "w") as config_file:
             toml.dump(config, config_file)
         # print("Done.")
 
-    def run(self, realtime=False):
-        print("Running...")
-        print("_" * 30)
-        if realtime:
-            result = subprocess.run(
-                [self.rust], text=True, stdout=subprocess.PIPE, capture_output=True)
-            result_float = -1
+    def run(self, realtime=False, progress=None, timeout=None, cancel=None, tail=50,
+            quiet=False, log=None):
+        """
+        Run the binary on the current config, streaming its output line by
+        line; only the last `tail` lines of stdout and stderr are kept.
+
+        Args:
+            realtime: echo the child output while it runs
+            progress: callback(t, tf) called for every `t=` line of the child
+            timeout: wall-clock limit in seconds, past which the child is killed
+            cancel: threading.Event that kills the child when set
+            tail: number of output lines kept
+            quiet: batch mode, nothing is printed and, without `progress`, the
+                   child stdout is read in large chunks keeping only its end,
+                   enough for the final velocity and the termination reason
+            log: file where the child stderr is spooled, instead of being
+                 printed (or discarded in quiet mode)
+
+        Returns:
+            final velocity, NaN if the run was killed or it could not be read
+        """
+        say = (lambda *args, **kwargs: None) if quiet else print
+        if self.cache is not None:
+            key = self.cache.key(self.config_path, self.input_files(), self.binary_fingerprint())
+            cached = self.cache.get(key, self.outputs())
+            if cached is not None:
+                say("Found in cache: ", key[:16])
+                velocity, self.termination = cached
+                if self.catalog is not None:
+                    self.catalog.record(self, velocity)
+                return velocity
+        say("Running...")
+        say("_" * 30)
+        tf = toml.load(self.config_path)['tf']
+        stdout_tail = deque(maxlen=tail)
+        stderr_tail = deque(maxlen=tail)
+        with contextlib.ExitStack() as stack:
+            if log is not None:
+                stderr = stack.enter_context(open(log, 'w'))
+            elif quiet:
+                stderr = subprocess.DEVNULL
+            else:
+                stderr = subprocess.PIPE
+            start = time.monotonic()
+            process = subprocess.Popen([self.rust, self.config_path], text=True, bufsize=1,
+                                       stdout=subprocess.PIPE, stderr=stderr)
+            if stderr == subprocess.PIPE:
+                # stderr is drained aside, so that a chatty child never blocks on a full pipe
+                stderr_reader = threading.Thread(target=stderr_tail.extend, args=(process.stderr,),
+                                                 daemon=True)
+                stderr_reader.start()
+            killed = []
+            if timeout is not None or cancel is not None:
+                watchdog = threading.Thread(target=stop_process, daemon=True,
+                                            args=(process, timeout, cancel, killed))
+                watchdog.start()
+
+            if quiet and progress is None and not realtime:
+                # only the end of the output matters: raw reads, nothing decoded on the way,
+                # and a short wait after a partial read so that the pipe fills between reads
+                fd = process.stdout.fileno()
+                end = b""
+                for chunk in iter(lambda: os.read(fd, 1 << 16), b""):
+                    end = (end + chunk)[-4096:]
+                    if len(chunk) < 1 << 15:
+                        time.sleep(0.002)
+                stdout_tail.extend(end.decode(errors='replace').splitlines(keepends=True))
+            else:
+                for line in process.stdout:
+                    stdout_tail.append(line)
+                    if realtime:
+                        print(line, end="")
+                    if progress is not None:
+                        match = PROGRESS_LINE.match(line)
+                        if match:
+                            progress(float(match.group(1)), tf)
+            process.wait()
+            if stderr == subprocess.PIPE:
+                stderr_reader.join()
+        runtime = time.monotonic() - start
+
+        result_float = np.nan
+        self.termination = None
+        if killed:
+            self.termination = killed[0]
+            say(f"\033[91mRun {killed[0]}, child killed\033[0m")
         else:
-            result = subprocess.run(
-                [self.rust], capture_output=True, text=True)
-            output = result.stdout.strip()
-            lines = output.splitlines()
-            last_line = lines[-1].strip()
+            for line in stdout_tail:
+                if line.startswith("Terminated"):
+                    self.termination = line.strip()
+            last_line = stdout_tail[-1].strip() if stdout_tail else ""
             try:
                 result_float = np.double(last_line)
-            except:
-                print("\033[91Failed to read final velocity\033[0m")
-                pass
-        print(result.stdout)
-        colored_text = result.stderr
+            except ValueError:
+                say("\033[91mFailed to read final velocity\033[0m")
+        if not realtime:
+            say("".join(stdout_tail))
+        colored_text = "".join(stderr_tail)
         if "panicked" in colored_text:
             colored_text = colored_text.replace(
                 "panicked", "\033[91mpanicked\033[0m")
-        print(colored_text)
-        print("_" * 30)
+        say(colored_text)
+        say("_" * 30)
         # print("Done.")
+        if self.cache is not None and not np.isnan(result_float):
+            self.cache.put(key, result_float, self.outputs(), self.termination)
+        if self.catalog is not None and not np.isnan(result_float):
+            self.catalog.record(self, result_float, runtime)
         return result_float
 
+    def resume(self, extra_time, **kwargs):
+        """
+        Extend the last run by `extra_time` seconds, continuing from its
+        checkpoint instead of recomputing the trajectory from t=0. The run must
+        have been made with `checkpoint = True` and the same parameters; the
+        outputs and the checkpoint are replaced by the ones of the extended run.
+        Keyword arguments are forwarded to `run`.
+
+        Returns:
+            final velocity of the extended run
+        """
+        path = self.checkpoint_path()
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No checkpoint at {path}, run with checkpoint = True first")
+        t_f, checkpoint = self.t_f, self.checkpoint
+        self.t_f += extra_time
+        self.checkpoint = True
+        self.resume_from = path
+        try:
+            self.write_config()
+            return self.run(**kwargs)
+        except BaseException:
+            # the run was not extended, keep the launch as it was
+            self.t_f, self.checkpoint = t_f, checkpoint
+            raise
+        finally:
+            # leave a config that reproduces the last completed run from scratch
+            self.resume_from = None
+            self.write_config()
+
+    def with_overrides(self, override):
+        """
+        Copy of this launch, outside of any workspace, with some attributes changed.
+        """
+        launch = copy.copy(self)
+        launch.workspace = None
+        launch.temporary_workspace = False
+        for key, value in override.items():
+            if not hasattr(launch, key):
+                raise AttributeError(f"Launch has no attribute '{key}'")
+            setattr(launch, key, value)
+        return launch
+
+    def run_lubin_many(self, overrides, record_every=None):
+        """
+        Integrate a batch of configurations in lubin (no-delay) mode in a single
+        vectorized NumPy call instead of one binary run each, see `lubin.integrate`.
+        The mode of the launch is ignored; a cell overriding it with another
+        mode raises ValueError rather than being integrated with lubin dynamics.
+
+        Args:
+            overrides: list of dicts {attribute: value}, as in `run_many`
+            record_every: keep one trajectory sample every `record_every` steps
+
+        Returns:
+            array of final velocities in the order of `overrides`, and the
+            decimated trajectories if `record_every` is given
+        """
+        for (i, override) in enumerate(overrides):
+            if override.get("mode", "lubin") != "lubin":
+                raise ValueError(f"Cell {i} has mode '{override['mode']}', run_lubin_many only integrates lubin mode")
+        configs = [self.with_overrides(override).get_config() for override in overrides]
+        return lubin.integrate_configs(configs, record_every=record_every)
+
+    def run_many(self, overrides, workers=None, progress=True, timeout=None, on_result=None,
+                 reduce=None, retries=0, memory_per_task=None, log_folder=None):
+        """
+        Run a batch of simulations concurrently through a `scheduling.Scheduler`,
+        each one on a copy of this launch with some attributes overridden, in
+        its own temporary workspace. The longest runs are started first.
+
+        Args:
+            overrides: list of dicts {attribute: value}, e.g. [{"eta": 0.5, "mode": "delay"}]
+            workers: number of simultaneous runs (default: cores, bounded by memory_per_task)
+            progress: show a progress bar on stderr
+            timeout: wall-clock limit of each run in seconds
+            on_result: callback(index, result) called as soon as each run completes
+            reduce: callback(launch, velocity) computing the result of a run from
+                    its outputs, before its workspace is deleted
+            retries: additional attempts of a failed (NaN) run
+            memory_per_task: expected peak memory of a run in bytes
+            log_folder: spool the stderr of run i to <log_folder>/run_<i>.log,
+                        it is discarded when None
+
+        Returns:
+            array of final velocities (NaN for the failed runs), or list of the
+            results of `reduce`, in the same order as `overrides`
+        """
+        scheduler = Scheduler(workers, memory_per_task, timeout, retries, progress)
+        if log_folder is not None:
+            os.makedirs(log_folder, exist_ok=True)
+
+        def task(item, timeout, cancel):
+            i, override = item
+            launch = self.with_overrides(override)
+            launch.use_workspace()
+            log = None if log_folder is None else os.path.join(log_folder, f'run_{i}.log')
+            try:
+                launch.write_config(quiet=True)
+                velocity = launch.run(timeout=timeout, cancel=cancel, quiet=True, log=log)
+                return velocity if reduce is None else reduce(launch, velocity)
+            finally:
+                launch.release_workspace()
+
+        def cost(item):
+            # the delay history is searched linearly at every step
+            launch = self.with_overrides(item[1])
+            return launch.get_tf()**2 if launch.mode == "delay" else launch.get_tf()
+
+        def on_final(i, result):
+            if on_result is not None:
+                on_result(i, np.nan if reduce is None and result is None else result)
+
+        results = scheduler.map(task, list(enumerate(overrides)), cost=cost, on_result=on_final)
+        if reduce is None:
+            return np.array([np.nan if r is None else r for r in results], dtype=np.float64)
+        return results
+
     def show(self):
         # Table headers and layout
         header_width = 35
@@ -182,6 +595,7 @@ class Launch:
         # print(f"{'Rust Version':<{header_width}}{self.rust}")
         print(f"{'Mode':<{header_width}}{self.mode}")
         print(f"{'Output File':<{header_width}}{self.file}")
+        print(f"{'Output Format':<{header_width}}{self.output_format}")
         print(f"{'Output Folder':<{header_width}}{self.output_folder}")
         print("\n" + "=" * (header_width + value_width))
         print(f"{'Normalized values':<{header_width-15}}{'Value':>{value_width}}")
@@ -196,123 +610,208 @@ class Launch:
         print(f"{'t_f':<{header_width}}{self.t_f/self.get_t_rel():.2e}")
         print("=" * (header_width + value_width))
 
-    def plot_dynamics(self, na = ""):
-        print("Plotting from: ", self.output_folder + self.file)
-        df = pd.read_csv(self.output_folder + self.file)
+    def trajectory_path(self):
+        """
+        Path of the trajectory written by the binary: in npy format the
+        extension of `file` is replaced by .npy.
+        """
+        path = self.output_folder + self.file
+        if self.output_format == 'npy':
+            path = os.path.splitext(path)[0] + '.npy'
+        return path
+
+    def checkpoint_path(self):
+        """
+        Path of the checkpoint written by the binary next to the trajectory.
+        """
+        return os.path.splitext(self.output_folder + self.file)[0] + '.ckpt'
+
+    def read_trajectory(self, file_path=None):
+        """
+        Read a trajectory as a dict of columns Time, q, Q, P, T. The .npy files
+        are memory-mapped and the columns are zero-copy views; CSV results
+        are parsed as before. A .csv path is served from its .npy sibling when
+        that is the most recent of the two.
+        """
+        if file_path is None:
+            file_path = self.trajectory_path()
+        root, ext = os.path.splitext(file_path)
+        if ext == '.csv' and os.path.exists(root + '.npy') and \
+           (not os.path.exists(file_path) or os.path.getmtime(root + '.npy') >= os.path.getmtime(file_path)):
+            file_path, ext = root + '.npy', '.npy'
+        if ext == '.npy':
+            data = np.load(file_path, mmap_mode='r')
+            return {name: data[:, i] for (i, name) in enumerate(TRAJECTORY_COLUMNS)}
+        df = pd.read_csv(file_path, dtype=np.float64, float_precision='round_trip')
+        return {name: df[name].to_numpy() for name in TRAJECTORY_COLUMNS}
+
+    def trajectory_summary(self, t_limit=None, chunk=1 << 20, file_path=None):
+        """
+        Reductions of a trajectory in one streaming pass over chunks of its
+        columns, so that a memory-mapped .npy file is never loaded whole.
+
+        Args:
+            t_limit: temperature limit in K
+            chunk: number of samples per chunk
+
+        Returns:
+            dict of max_Q, max_T and time_above, the time in seconds spent
+            with T above `t_limit` (0 if not given)
+        """
+        data = self.read_trajectory(file_path)
+        time, Q, T = data['Time'], data['Q'], data['T']
+        n = len(time)
+        max_Q = max_T = -np.inf
+        above = 0.0
+        for start in range(0, n, chunk):
+            stop = min(start + chunk, n)
+            max_Q = max(max_Q, np.max(Q[start:stop]))
+            T_chunk = np.asarray(T[start:stop])
+            max_T = max(max_T, np.max(T_chunk))
+            if t_limit is not None:
+                # steps starting above the limit, the next chunk provides the last end point
+                steps = np.diff(np.asarray(time[start:min(stop + 1, n)]))
+                above += np.sum(steps[T_chunk[:len(steps)] > t_limit])
+        return {"max_Q": float(max_Q), "max_T": float(max_T),
+                "time_above": float(above * self.get_t_rel())}
+
+    def plot_dynamics(self, na = "", max_points=4000, parallel=False):
+        """
+        Plot q, Q, P and T against time, one PDF each.
+
+        Args:
+            na: suffix of the output names
+            max_points: per-panel point budget, series are downsampled above
+                        it keeping the min and max of every bucket
+            parallel: write the four panels concurrently
+        """
+        print("Plotting from: ", self.trajectory_path())
+        df = self.read_trajectory()
 
         time = df['Time']
         q = df['q']
-        Q = df['Q']
-        P = df['P']
-        T = df['T']
         file_type = '.pdf'
         grid = False
         lw = 0.5
 
-        # Plotting q
-        plt.figure(figsize=(3, 2.5))
-        plt.plot(time, q, linestyle='-', color='g', label=r'$q$', linewidth=lw)
-        plt.xlabel(r'$t/t_{\mathrm{rel}}$')
-        plt.ylabel(r'$q$')
-        plt.grid(grid)
         l_d = self.get_l_d()
-        if l_d < np.max(q):
-            plt.axhline(l_d, ls="--", color="r", lw=1)
-        # plt.legend()
-        plt.tight_layout()
-        plt.savefig('media/q'+na+file_type)
-        print("Saved plot to: ", 'media/q'+na+file_type)
-
-        # Plotting Q
-        plt.figure(figsize=(3, 2.5))
-        plt.plot(time, Q, linestyle='-', color='b', label=r'$Q$', linewidth=lw)
-        plt.xlabel(r'$t/t_{\mathrm{rel}}$')
-        plt.ylabel(r'$\dot{q}/c$')
-        plt.grid(grid)
-        plt.axhline(0.2, ls="--", color="r", lw=1)
-        # plt.legend()
-        plt.tight_layout()
-        plt.savefig('media/qdot'+na+file_type)
-        print("Saved plot to: ", 'media/qdot'+na+file_type)
-
-        # Plotting P
-        # P = np.where(P == 1.0, np.nan,  P)
-        plt.figure(figsize=(3, 2.5))
-        plt.plot(time, P, linestyle='-', color='r', label=r'$P$', linewidth=lw)
-        plt.xlabel(r'$t/t_{\mathrm{rel}}$')
-        plt.ylabel(r'$P/P_0$')
-        plt.grid(grid)
-        # plt.legend()
-        plt.tight_layout()
-        name = "media/P"+na+file_type
-        plt.savefig(name)  # Save plot as PDF for LaTeX
-        print("Saved plot to: ", name)
-
-        # Plotting T
-        plt.figure(figsize=(3, 2.5))
-        plt.plot(time, T, linestyle='-', color='red', label=r'$T$', linewidth=lw)
-        plt.xlabel(r'$t/t_{\mathrm{rel}}$')
-        plt.ylabel(r'$T$')
-        plt.grid(grid)
-        # plt.axhline(1000, ls="--", color="r", lw=1)
-        # plt.axhline(2000, ls="--", color="r", lw=1)
-        # plt.legend()
-        plt.tight_layout()
-        name = "media/T"+na+file_type
-        plt.savefig(name)  # Save plot as PDF for LaTeX
-        print("Saved plot to: ", name)
+        # (output, column, color, label, ylabel, horizontal line)
+        panels = [
+            ('media/q', 'q', 'g', r'$q$', r'$q$', l_d if l_d < np.max(q) else None),
+            ('media/qdot', 'Q', 'b', r'$Q$', r'$\dot{q}/c$', 0.2),
+            ('media/P', 'P', 'r', r'$P$', r'$P/P_0$', None),
+            ('media/T', 'T', 'red', r'$T$', r'$T$', None),
+        ]
+
+        jobs = []
+        for (output, column, color, label, ylabel, hline) in panels:
+            y = df[column]
+            kept = decimate.minmax_indices(y, max_points)
+            jobs.append((output + na + file_type, np.asarray(time[kept]), np.asarray(y[kept]),
+                         color, label, ylabel, hline, grid, lw))
+
+        if parallel:
+            # mathtext is not thread safe, hence processes; only the decimated series are sent
+            with ProcessPoolExecutor(max_workers=len(jobs)) as executor:
+                names = list(executor.map(save_panel, *zip(*jobs)))
+        else:
+            names = [save_panel(*job) for job in jobs]
+        for name in names:
+            print("Saved plot to: ", name)
 
     def read_speed_from_csv(self, file_path):
-        df = pd.read_csv(file_path)
-        times = np.array(df['Time'])
-        positions = np.array(df['q'])
-        speeds = np.array(df['Q'])
-        total_powers = np.array(df['P'])
+        df = self.read_trajectory(file_path)
+        times = np.asarray(df['Time'])
+        positions = np.asarray(df['q'])
+        speeds = np.asarray(df['Q'])
+        total_powers = np.asarray(df['P'])
         return times, positions, speeds, total_powers
 
-    def read_spectral_components_from_csv(self, file_path):
-        frequencies = []
-        powers = []
-
-        with open(file_path, newline='') as csvfile:
-            reader = csv.reader(csvfile)
-            header = next(reader)
-            row_count = 0
-            for row in reader:
-                if row_count % 2 == 0:  # Frequencies (even index)
-                    frequencies.append(list(map(float, row)))
-                else:  # Powers (odd index)
-                    powers.append(list(map(float, row)))
-                row_count += 1
-        return np.array(frequencies), np.array(powers)
-
-    def plot_spectrum(self, threshold=0.0, zoom=1, na=""):
+    def read_spectral_components_from_csv(self, file_path, stride=1, window=None):
+        """
+        Read the spectrum written by the binary, where every time step is a
+        row of frequencies followed by a row of powers, one column per line.
+
+        The file is parsed in bulk once and stored in a .npy sidecar named
+        after its mtime, which later calls memory-map.
+
+        Args:
+            file_path: spectrum CSV
+            stride: keep one time step every `stride`
+            window: (first, last) time steps to keep, all when None
+
+        Returns:
+            frequencies, powers: arrays of shape (time steps, lines)
+        """
+        sidecar = f"{file_path}.{os.stat(file_path).st_mtime_ns}.npy"
+        if os.path.exists(sidecar):
+            spectrum = np.load(sidecar, mmap_mode='r')
+        else:
+            spectrum = self.parse_spectrum(file_path, sidecar)
+        first, last = window if window is not None else (0, spectrum.shape[1])
+        selection = spectrum[:, first:last:stride, :]
+        return np.array(selection[0]), np.array(selection[1])
+
+    @staticmethod
+    def parse_spectrum(file_path, sidecar, chunk_steps=4096):
+        """
+        Parse a spectrum CSV into an array of shape (2, time steps, lines),
+        written directly into the sidecar file when possible.
+        """
+        with open(file_path, 'rb') as f:
+            n_columns = f.readline().count(b',') + 1
+            n_rows = sum(chunk.count(b'\n') for chunk in iter(lambda: f.read(1 << 24), b''))
+        shape = (2, n_rows // 2, n_columns)
+        staging = f"{sidecar}.{os.getpid()}.tmp"
+        try:
+            spectrum = np.lib.format.open_memmap(staging, mode='w+', dtype=np.float64, shape=shape)
+        except OSError:
+            staging = None
+            spectrum = np.empty(shape, dtype=np.float64)
+
+        step = 0
+        for chunk in pd.read_csv(file_path, dtype=np.float64, float_precision='round_trip', chunksize=2 * chunk_steps):
+            rows = chunk.to_numpy()
+            n = len(rows) // 2
+            spectrum[0, step:step + n] = rows[0:2 * n:2]  # frequencies
+            spectrum[1, step:step + n] = rows[1:2 * n:2]  # powers
+            step += n
+
+        if staging is not None:
+            spectrum.flush()
+            for old in glob.glob(glob.escape(file_path) + '.*.npy'):
+                os.remove(old)
+            os.replace(staging, sidecar)
+        return spectrum
+
+    def plot_spectrum(self, threshold=0.0, zoom=1, na="", max_points=1000, rasterize=True):
+      """
+      Args:
+          threshold: lines with a lower power are not drawn
+          zoom: zoom factor of the time axis
+          na: suffix of the output name
+          max_points: per-line point budget, lines are decimated with LTTB above it
+          rasterize: rasterize the spectral lines, keeping axes and labels vector
+      """
 
       print("Plotting spectrum...")
-      frequencies, powers = self.read_spectral_components_from_csv('results/spectrum.csv')
-      times, positions, speeds, total_powers = self.read_speed_from_csv('results/delay.csv')
       skip = 20
+      frequencies, powers = self.read_spectral_components_from_csv(self.output_folder + 'spectrum.csv', stride=skip)
+      times, positions, speeds, total_powers = self.read_speed_from_csv(self.trajectory_path())
       speeds = speeds[2::skip]
       positions = positions[2::skip]
       times = times[2::skip]
-      frequencies = frequencies[::skip, :]
-      powers = powers[::skip, :]
       total_powers = total_powers[2::skip]
-      sqrt_d = np.sqrt((1-speeds)/(1+speeds))
-      tot_frequencies = frequencies.shape[1]
-
-      for j in range(tot_frequencies):
-          frequencies[:, j] *= sqrt_d
-          powers[:, j] *= sqrt_d
-          frequencies[:, j] = np.where(powers[:, j] < threshold, np.nan, frequencies[:, j])
+      sqrt_d = np.sqrt((1-speeds)/(1+speeds))[:, np.newaxis]
 
+      frequencies *= sqrt_d
+      powers *= sqrt_d
       frequencies = np.where(frequencies == 0, np.nan, frequencies)
       frequencies = np.where(powers <= threshold, np.nan, frequencies)
 
       time_steps = np.arange(powers.shape[0])
 
-      config_path = 'input/_config.toml'
-      config = toml.load(config_path)
+      config = toml.load(self.config_path)
       tf = config['tf']
       time_axis = time_steps / len(time_steps) * tf
       max_time = time_axis[-1]
@@ -356,14 +855,15 @@ class Launch:
       cmap = LinearSegmentedColormap.from_list("PinkToBrownContinuous", colors)
       adj_cmap = adjust_luminosity_contrast(cmap, 0.6, 2.5)
 
-      for j in range(tot_frequencies):
-          points = np.array([time_axis, frequencies[:, j]]).T.reshape(-1, 1, 2)
-          segments = np.concatenate([points[:-1], points[1:]], axis=1)
-          lc = LineCollection(segments, cmap="YlOrRd", norm=norm)
-          lc.set_array(powers[:, j])
-          lc.set_linewidth(1.5)
-          lc.set_alpha(1.0)
-          ax_heat.add_collection(lc)
+      # all the lines in a single collection, decimated to the point budget
+      mask = decimate.lttb_mask(time_axis, frequencies, max_points)
+      segments, segment_powers = decimate.segments(time_axis, frequencies, powers, mask)
+      lc = LineCollection(segments, cmap="YlOrRd", norm=norm)
+      lc.set_array(segment_powers)
+      lc.set_linewidth(1.5)
+      lc.set_alpha(1.0)
+      lc.set_rasterized(rasterize)
+      ax_heat.add_collection(lc)
 
       ax_heat.set_xlim(time_axis.min(), time_axis.max() / zoom)
       green_threshold = 0.5
@@ -389,5 +889,6 @@ class Launch:
       cbar.set_label(r"$P_i'/P_0$")
       
       plt.tight_layout()
-      plt.savefig("media/spectrum_"+na+".pdf")
-      print("Saved to media/spectrum_"+na+".pdf")
\ No newline at end of file
+      plt.savefig("media/spectrum_"+na+".pdf", dpi=300)
+      print("Saved to media/spectrum_"+na+".pdf")
+      plt.close(fig)
\ No newline at end of file
@@ -0,0 +1,185 @@
+import numpy as np
+from scipy.interpolate import RBFInterpolator
+from scipy.spatial import cKDTree
+from sweep import mode_label, label_mode, mode_overrides
+
+
+class Surrogate:
+    """
+    Fast model of the final velocity as a function of some Launch attributes
+    (e.g. p_0 and eta), one radial basis function interpolant per mode,
+    trained from sweep results and refined with true runs where needed.
+
+    The uncertainty of a prediction is the k-fold cross-validation error of
+    the mode's interpolant, scaled by the distance to the nearest training
+    point in units of the typical sample spacing. A query is trusted if it
+    lies inside the training bounds and within `trust` spacings of a sample.
+
+    Args:
+        inputs: names of the Launch attributes the model depends on
+        trust: trusted distance from the samples, in sample spacings
+        smoothing: RBF smoothing, 0 interpolates the samples exactly
+        folds: folds of the cross-validation
+    """
+    def __init__(self, inputs, trust=1.5, smoothing=0.0, folds=5):
+        self.inputs = list(inputs)
+        self.trust = trust
+        self.smoothing = smoothing
+        self.folds = folds
+        self.data = {}    # mode label -> (points, values)
+        self.specs = {}   # mode label -> mode, to schedule runs
+        self.models = {}
+
+    def add(self, mode, points, values):
+        """
+        Add samples of a mode.
+
+        Args:
+            mode: (mode, Reflector) pair, dict of attributes, or label
+            points: array of shape (n, len(inputs))
+            values: final velocities, shape (n,)
+        """
+        label = mode if isinstance(mode, str) else mode_label(mode)
+        if not isinstance(mode, str):
+            self.specs[label] = mode
+        points = np.asarray(points, dtype=np.float64).reshape(-1, len(self.inputs))
+        values = np.asarray(values, dtype=np.float64).ravel()
+        valid = np.isfinite(values)
+        old_points, old_values = self.data.get(label, (np.empty((0, len(self.inputs))), np.empty(0)))
+        self.data[label] = (np.vstack([old_points, points[valid]]),
+                            np.concatenate([old_values, values[valid]]))
+        self.models.pop(label, None)
+
+    def add_result(self, result, fixed=None):
+        """
+        Add the samples of a SweepResult. Inputs that are not dimensions of the
+        result must be given in `fixed`, e.g. fixed={"p_0": 50e9} for an eta sweep.
+        """
+        fixed = dict(fixed or {})
+        dims = [d for d in result.dims if d != "mode"]
+        grids = np.meshgrid(*(result.coords[d] for d in dims), indexing="ij")
+        columns = []
+        for name in self.inputs:
+            if name in dims:
+                columns.append(grids[dims.index(name)].ravel())
+            else:
+                columns.append(np.full(grids[0].size, fixed[name], dtype=np.float64))
+        points = np.column_stack(columns)
+        values = np.moveaxis(result.values, result.axis("mode"), 0)
+        for (j, label) in enumerate(result.coords["mode"]):
+            self.add(str(label), points, values[j].ravel())
+
+    def scale(self, label, points):
+        low, high = self.models[label]["bounds"]
+        return (points - low) / np.where(high > low, high - low, 1.0)
+
+    def fit(self, label):
+        points, values = self.data[label]
+        low, high = points.min(axis=0), points.max(axis=0)
+        self.models[label] = {"bounds": (low, high)}
+        x = self.scale(label, points)
+        # keep the inputs that actually vary, RBFs need a full-rank point set
+        varying = high > low
+        if not varying.any():
+            # all the samples at a single point, only trusted there
+            self.models[label].update(model=None, varying=varying, value=np.mean(values),
+                                      error=np.std(values))
+            return
+        x = x[:, varying]
+        model = RBFInterpolator(x, values, smoothing=self.smoothing)
+
+        # cross-validation error and typical spacing of the samples
+        n = len(values)
+        order = np.random.default_rng(0).permutation(n)
+        residuals = []
+        for fold in range(min(self.folds, n)):
+            test = order[fold::self.folds]
+            train = np.setdiff1d(order, test)
+            if len(train) <= x.shape[1] + 1:
+                continue
+            try:
+                partial = RBFInterpolator(x[train], values[train], smoothing=self.smoothing)
+            except (ValueError, np.linalg.LinAlgError):
+                continue
+            residuals.append(partial(x[test]) - values[test])
+        error = np.sqrt(np.mean(np.concatenate(residuals)**2)) if residuals else np.inf
+        tree = cKDTree(x)
+        spacing = np.median(tree.query(x, k=2)[0][:, 1]) if n > 1 else 1.0
+
+        self.models[label].update(model=model, varying=varying, tree=tree,
+                                  error=error, spacing=spacing)
+
+    def predict(self, mode, points):
+        """
+        Vectorized query.
+
+        Args:
+            mode: mode or label
+            points: array of shape (n, len(inputs))
+
+        Returns:
+            values, uncertainties and a boolean mask of the trusted queries
+        """
+        label = mode if isinstance(mode, str) else mode_label(mode)
+        if label not in self.models:
+            self.fit(label)
+        m = self.models[label]
+        points = np.asarray(points, dtype=np.float64).reshape(-1, len(self.inputs))
+        x = self.scale(label, points)
+        # inputs constant in the training set are only trusted at that value
+        inside = np.all(np.where(m["varying"], (x >= -1e-9) & (x <= 1 + 1e-9),
+                                 np.isclose(points, m["bounds"][0])), axis=1)
+        if m["model"] is None:
+            return np.full(len(points), m["value"]), np.where(inside, m["error"], np.inf), inside
+        x = x[:, m["varying"]]
+        distance = m["tree"].query(x)[0] / m["spacing"]
+        values = m["model"](x)
+        sigma = m["error"] * distance
+        return values, sigma, inside & (distance <= self.trust)
+
+    def refine(self, launch, mode, points, **kwargs):
+        """
+        Answer queries, running the binary (through `launch.run_many`, keyword
+        arguments are forwarded) where the model is not trusted, and learning
+        from those runs.
+
+        Returns:
+            values, uncertainties (0 for the computed points) and the mask of
+            the points that were computed
+        """
+        label = mode if isinstance(mode, str) else mode_label(mode)
+        if not isinstance(mode, str):
+            spec = mode
+        else:
+            # labels of sweeps and of saved models are not in `specs`
+            spec = self.specs[label] if label in self.specs else label_mode(label)
+        points = np.asarray(points, dtype=np.float64).reshape(-1, len(self.inputs))
+        if label in self.data:
+            values, sigma, trusted = self.predict(label, points)
+        else:
+            values, sigma = np.full(len(points), np.nan), np.full(len(points), np.inf)
+            trusted = np.zeros(len(points), dtype=bool)
+        todo = np.flatnonzero(~trusted)
+        if len(todo):
+            overrides = [dict(zip(self.inputs, points[i].tolist()), **mode_overrides(spec))
+                         for i in todo]
+            computed = launch.run_many(overrides, **kwargs)
+            self.add(spec, points[todo], computed)
+            values[todo] = computed
+            sigma[todo] = 0.0
+        return values, sigma, ~trusted
+
+    def save(self, path):
+        arrays = {}
+        for (j, (label, (points, values))) in enumerate(self.data.items()):
+            arrays[f"points_{j}"] = points
+            arrays[f"values_{j}"] = values
+        np.savez(path, inputs=np.array(self.inputs), labels=np.array(list(self.data)), **arrays)
+
+    @staticmethod
+    def load(path, **kwargs):
+        with np.load(path) as data:
+            surrogate = Surrogate([str(i) for i in data["inputs"]], **kwargs)
+            for (j, label) in enumerate(data["labels"]):
+                surrogate.add(str(label), data[f"points_{j}"], data[f"values_{j}"])
+        return surrogate
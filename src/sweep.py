@@ -0,0 +1,221 @@
+import os
+import json
+import time
+import itertools
+import numpy as np
+from simulation import Reflector
+from cache import normalize_config
+
+
+def mode_overrides(mode):
+    """
+    Launch attributes of a mode, given as a (mode, Reflector) pair or as a dict.
+    """
+    if isinstance(mode, dict):
+        return dict(mode)
+    return {"mode": mode[0], "multilayer": mode[1]}
+
+
+def mode_label(mode):
+    if isinstance(mode, dict):
+        return ",".join(f"{k}={v.name if isinstance(v, Reflector) else v}" for (k, v) in mode.items())
+    return f"{mode[0]}_{mode[1].name}"
+
+
+def label_mode(label):
+    """
+    Inverse of `mode_label` for the (mode, Reflector) pairs.
+    """
+    mode, reflector = str(label).rsplit("_", 1)
+    return (mode, Reflector[reflector])
+
+
+def cell_key(launch, override):
+    """
+    Canonical text of the normalized config of a cell, used to recognize it on restart.
+    """
+    return normalize_config(launch.with_overrides(override).get_config())
+
+
+class CellLog:
+    """
+    Durable append-only log of completed cells, one JSON line each. Lines are
+    flushed at once and fsync-ed every `sync_every` records or `sync_interval`
+    seconds, so a crash loses at most the last unsynced batch.
+    """
+    def __init__(self, path, sync_every=32, sync_interval=10.0):
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.pending = 0
+        self.last_sync = time.monotonic()
+        self.file = None
+
+    def load(self):
+        """
+        Completed cells as a dict {cell key: velocity}; a line torn by a crash is skipped.
+        """
+        done = {}
+        if not os.path.exists(self.path):
+            return done
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                done[record["key"]] = record["velocity"]
+        return done
+
+    def append(self, key, velocity):
+        if self.file is None:
+            self.file = open(self.path, 'a+')
+            # terminate a line torn by a crash, so that it does not swallow the next record
+            if self.file.tell() > 0:
+                self.file.seek(self.file.tell() - 1)
+                if self.file.read(1) != "\n":
+                    self.file.write("\n")
+        self.file.write(json.dumps({"key": key, "velocity": velocity}) + "\n")
+        self.file.flush()
+        self.pending += 1
+        if self.pending >= self.sync_every or time.monotonic() - self.last_sync > self.sync_interval:
+            self.sync()
+
+    def sync(self):
+        if self.file is not None and self.pending:
+            os.fsync(self.file.fileno())
+        self.pending = 0
+        self.last_sync = time.monotonic()
+
+    def close(self):
+        if self.file is not None:
+            self.sync()
+            self.file.close()
+            self.file = None
+
+
+class SweepResult:
+    """
+    N-D array of final velocities with the names and coordinates of its axes.
+    """
+    def __init__(self, values, dims, coords):
+        self.values = values
+        self.dims = list(dims)
+        self.coords = dict(coords)
+
+    def axis(self, name):
+        return self.dims.index(name)
+
+    def sel(self, **indexers):
+        """
+        Sub-array at the given coordinate values, e.g. sel(mode="delay_M1").
+        """
+        index = [slice(None)] * len(self.dims)
+        for (name, value) in indexers.items():
+            matches = np.flatnonzero(np.asarray(self.coords[name]) == value)
+            if len(matches) == 0:
+                raise KeyError(f"{value!r} is not a coordinate of '{name}'")
+            index[self.axis(name)] = matches[0]
+        dims = [d for (d, i) in zip(self.dims, index) if isinstance(i, slice)]
+        return SweepResult(self.values[tuple(index)], dims, {d: self.coords[d] for d in dims})
+
+    def save(self, path):
+        np.savez(path, values=self.values, dims=np.array(self.dims),
+                 **{"coord_" + d: np.asarray(self.coords[d]) for d in self.dims})
+
+    @staticmethod
+    def load(path):
+        with np.load(path) as data:
+            dims = [str(d) for d in data["dims"]]
+            return SweepResult(data["values"], dims, {d: data["coord_" + d] for d in dims})
+
+    @staticmethod
+    def from_array(path, sweep):
+        """
+        Result of `sweep` from a bare .npy array of its values, the format
+        of the results saved before SweepResult.
+        """
+        values = np.load(path)
+        if values.shape != sweep.shape:
+            raise ValueError(f"{path} has shape {values.shape}, expected {sweep.shape}")
+        return SweepResult(values, sweep.dims, sweep.coords)
+
+
+class Sweep:
+    """
+    A study declared as named axes over Launch attributes plus a list of modes,
+    e.g. Sweep({"p_0": powers, "eta": etas}, [("delay", Reflector.M1), ("lubin", Reflector.FLAT)]).
+    The result has one dimension per axis, in order, and a last "mode" dimension.
+
+    Args:
+        axes: dict {attribute: values}
+        modes: list of (mode, Reflector) pairs or dicts of attributes
+        fixed: attributes set for every cell
+    """
+    def __init__(self, axes, modes, fixed=None):
+        self.axes = {name: np.asarray(values) for (name, values) in axes.items()}
+        self.modes = list(modes)
+        self.fixed = dict(fixed or {})
+
+    @property
+    def dims(self):
+        return list(self.axes) + ["mode"]
+
+    @property
+    def shape(self):
+        return tuple(len(v) for v in self.axes.values()) + (len(self.modes),)
+
+    @property
+    def coords(self):
+        coords = dict(self.axes)
+        coords["mode"] = np.array([mode_label(m) for m in self.modes])
+        return coords
+
+    def cells(self):
+        """
+        Overrides of every cell, in C order of the result array.
+        """
+        names = list(self.axes)
+        overrides = []
+        for point in itertools.product(*self.axes.values(), self.modes):
+            override = dict(self.fixed)
+            override.update({name: value.item() for (name, value) in zip(names, point[:-1])})
+            override.update(mode_overrides(point[-1]))
+            overrides.append(override)
+        return overrides
+
+    def run(self, launch, log=None, **kwargs):
+        """
+        Run every cell in parallel through `launch.run_many` (keyword arguments
+        are forwarded to it) and return the labelled result.
+
+        With a `log` path every completed cell is appended to it as soon as it
+        finishes, and the cells already in the log are not run again, so an
+        interrupted sweep continues where it stopped. Failed (NaN) cells are
+        not logged and are retried.
+        """
+        cells = self.cells()
+        keys = [cell_key(launch, cell) for cell in cells]
+        values = np.full(len(cells), np.nan, dtype=np.float64)
+        cell_log = None
+        if log is not None:
+            cell_log = CellLog(log)
+            done = cell_log.load()
+            for (i, key) in enumerate(keys):
+                values[i] = done.get(key, np.nan)
+        missing = np.flatnonzero(np.isnan(values))
+        if len(missing) < len(cells):
+            print(f"Resuming: {len(cells) - len(missing)} of {len(cells)} cells already done")
+
+        def on_result(i, velocity):
+            if cell_log is not None and not np.isnan(velocity):
+                cell_log.append(keys[missing[i]], float(velocity))
+
+        try:
+            if len(missing):
+                values[missing] = launch.run_many([cells[i] for i in missing],
+                                                  on_result=on_result, **kwargs)
+        finally:
+            if cell_log is not None:
+                cell_log.close()
+        return SweepResult(values.reshape(self.shape), self.dims, self.coords)
@@ -193,6 +193,40 @@ where
     ftr
 }
 
+/// Solve for equilibrium temperature on a tabulated emission curve
+///
+/// Interpolates (log-log linear) P_absorbed / 2πd² on the table of
+/// (T, ∫ ε(ω) * I(ω, T) dω), strictly increasing in both columns, see
+/// `read_emission_table`.
+///
+/// # Returns
+/// * `Option<f64>` - Equilibrium temperature in K, or None outside of the table
+pub fn solve_temperature_table(
+    p_absorbed: f64,
+    diameter: f64,
+    table: &[(f64, f64)],
+) -> Option<f64> {
+    if p_absorbed <= 0.0 {
+        return Some(0.0);
+    }
+
+    if diameter <= 0.0 || table.len() < 2 {
+        return None;
+    }
+
+    let target = p_absorbed / (2.0 * PI * diameter * diameter);
+    if target < table[0].1 || target > table[table.len() - 1].1 {
+        return None;
+    }
+
+    // first point emitting at least the target
+    let i = table.partition_point(|&(_, emission)| emission < target).max(1);
+    let (t0, e0) = table[i - 1];
+    let (t1, e1) = table[i];
+    let w = (target.ln() - e0.ln()) / (e1.ln() - e0.ln());
+    Some((t0.ln() + w * (t1.ln() - t0.ln())).exp())
+}
+
 /*
 Compute the new temperature using the forward Euler method.
 */
@@ -248,4 +282,17 @@ mod tests {
         assert!(temperature.is_some());
         assert!(temperature.unwrap() > 0.0);
     }
+
+    #[test]
+    fn test_solve_temperature_table() {
+        let emissivity = |_x: f64| 0.5;
+        let table: Vec<(f64, f64)> = (0..4096)
+            .map(|i| 10f64.powf(4.0 * i as f64 / 4095.0))
+            .map(|t| (t, compute_rhs_integral(t, &emissivity, 1e10, 1e15, 1000)))
+            .collect();
+        let exact = solve_temperature(1e-6*50e9, 10.0, &emissivity, 1e10, 1e15,
+            Some(1000), Some(1e-6), Some((1.0, 10000.0))).unwrap();
+        let interpolated = solve_temperature_table(1e-6*50e9, 10.0, &table).unwrap();
+        assert!((interpolated - exact).abs() < 1e-3 * exact);
+    }
 }
\ No newline at end of file
@@ -0,0 +1,144 @@
+import toml
+import numpy as np
+import matplotlib.pyplot as plt
+from numba import njit
+import simulation
+import emission
+from demo_equilibrium import TABLE_FOLDER
+
+SPECIFIC_HEAT = 700.0  # J/(kg K), of silicon nitride near room temperature
+
+
+@njit(cache=True)
+def emitted_power(T, log_T, log_E):
+    """
+    Emitted power and its temperature derivative, by log-log linear
+    interpolation of the tabulated curve (extrapolated with the end slopes).
+    """
+    if T <= 0:
+        return 0.0, 0.0
+    x = np.log(T)
+    i = min(max(np.searchsorted(log_T, x), 1), len(log_T) - 1)
+    slope = (log_E[i] - log_E[i - 1]) / (log_T[i] - log_T[i - 1])
+    E = np.exp(log_E[i - 1] + slope * (x - log_T[i - 1]))
+    return E, slope * E / T
+
+
+@njit(cache=True)
+def integrate_heat(time, power, T0, heat_capacity, log_T, log_E, resolution, max_substeps):
+    """
+    Integrate C dT/dt = P(t) - E(T) over a trace of absorbed powers, with P
+    linear between the samples. Every interval is split in substeps of at most
+    `resolution` times the local thermal time constant C / E'(T), and short
+    enough to change T by at most a `resolution` fraction of it at the start
+    of the interval, so that the sparse stretches of a decimated trace are
+    about as accurate as the dense ones.
+    The substeps are linearized implicit Euler, stable whatever their count,
+    which is capped at `max_substeps` per interval.
+
+    Returns:
+        temperatures at the samples, substeps taken in every interval
+    """
+    n = len(time)
+    temperatures = np.empty(n)
+    substeps = np.zeros(n, dtype=np.int64)
+    T = T0
+    temperatures[0] = T
+    for k in range(n - 1):
+        dt = time[k + 1] - time[k]
+        if dt > 0:
+            E, dE = emitted_power(T, log_T, log_E)
+            # substeps resolving the time constant and keeping each change of T within `resolution`
+            rate = max(abs(power[k] - E), abs(power[k + 1] - E)) / heat_capacity
+            steps = max(dt * dE / (resolution * heat_capacity), dt * rate / (resolution * max(T, 1.0)))
+            steps = int(min(max(np.ceil(steps), 1), max_substeps))
+            h = dt / steps
+            for j in range(steps):
+                P = power[k] + (power[k + 1] - power[k]) * (j + 1) / steps
+                E, dE = emitted_power(T, log_T, log_E)
+                T = max(T + h * (P - E) / (heat_capacity + h * dE), 0.0)
+            substeps[k + 1] = steps
+        temperatures[k + 1] = T
+    return temperatures, substeps
+
+
+def thermal_power_scale(params='input/_params.toml'):
+    """
+    p_0 that the binary multiplies the thermal power with, read from the same
+    params file as `load_params` in types.rs (not from the Launch, which may differ).
+    """
+    with open(params) as f:
+        return toml.load(f)['p_0']
+
+
+def heat_capacity(launch, specific_heat=SPECIFIC_HEAT):
+    """
+    Heat capacity of the sail in J/K, from its areal density and area.
+    """
+    return specific_heat * launch.sigma * np.pi * launch.d_sail**2 / 4
+
+
+def emission_curve(launch, folder=TABLE_FOLDER):
+    """
+    Tabulated emitted power (T in K, E in W) of the sail of `launch`, with the
+    emissivity of the binary, see `emission.export_table`.
+    """
+    table = np.loadtxt(emission.export_table(launch, folder), delimiter=",", skiprows=1, ndmin=2)
+    return table[:, 0], 2 * np.pi * launch.d_sail**2 * table[:, 1]
+
+
+def transient_temperature(launch, specific_heat=SPECIFIC_HEAT, T0=None, file_path=None,
+                          resolution=0.05, max_substeps=1 << 16, folder=TABLE_FOLDER,
+                          params='input/_params.toml'):
+    """
+    Transient sail temperature of a saved run, integrating the heat equation
+    on the thermal power it recorded (the `q` column from the second row on,
+    in units of the p_0 of the params file) instead of the instantaneous
+    equilibrium solved by the binary. The trajectory can be decimated, see
+    `integrate_heat`.
+
+    Args:
+        specific_heat: of the sail material, in J/(kg K)
+        T0: initial temperature in K, the equilibrium at the first power when None
+        file_path: trajectory, that of the launch when None
+        resolution: substep length in units of the thermal time constant, and
+                    relative change of the temperature per substep
+        max_substeps: cap of the substeps of every interval
+        params: params file the binary read its p_0 from
+
+    Returns:
+        dict of time (s), power (W), T (K) and substeps of every interval,
+        one entry per row of the trajectory (the first row takes the power of the second)
+    """
+    data = launch.read_trajectory(file_path)
+    time = np.asarray(data['Time'], dtype=np.float64) * launch.get_t_rel()
+    power = np.asarray(data['q'], dtype=np.float64) * thermal_power_scale(params)
+    # the first row holds the initial position (main.rs), not a thermal power
+    if len(power) > 1:
+        power[0] = power[1]
+    T, E = emission_curve(launch, folder)
+    log_T, log_E = np.log(T), np.log(E)
+    if T0 is None:
+        T0 = np.exp(np.interp(np.log(max(power[0], E[0])), log_E, log_T)) if power[0] > 0 else 0.0
+    temperatures, substeps = integrate_heat(time, power, float(T0), heat_capacity(launch, specific_heat),
+                                            log_T, log_E, resolution, max_substeps)
+    return {"time": time, "power": power, "T": temperatures, "substeps": substeps}
+
+
+if __name__ == "__main__":
+    l = simulation.Launch()
+    l.mode = "delay"
+    result = transient_temperature(l)
+    equilibrium = np.asarray(l.read_trajectory()['T'])
+    print(f"max T: {np.max(result['T']):.1f} K transient, {np.max(equilibrium):.1f} K equilibrium, "
+          f"{np.sum(result['substeps'])} substeps")
+
+    fig, ax = plt.subplots(figsize=(4.2, 2.4))
+    ax.plot(result['time'], equilibrium, lw=0.5, color='gray', label='equilibrium')
+    ax.plot(result['time'], result['T'], lw=0.8, color='red', label='transient')
+    ax.set_xlabel(r'$t$ [s]')
+    ax.set_ylabel(r'$T$ [K]')
+    ax.legend()
+    plt.tight_layout()
+    plt.savefig('media/T_transient.pdf')
+    print("Saved plot to media/T_transient.pdf")
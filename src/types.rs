@@ -20,6 +20,26 @@ pub struct Config {
     pub multilayer: String,
     pub diffraction_constant: f64,
     pub sail_diameter: f64,
+    pub format: Option<String>, // "csv" (default) or "npy" for the trajectory
+    pub checkpoint: Option<bool>, // save the final state next to the trajectory, as <file>.ckpt
+    pub resume: Option<String>, // continue from this checkpoint instead of starting at t=0
+    pub emission_table: Option<String>, // tabulated emission curve of the sail, see solve_temperature_table
+}
+
+// full state of a run at its last step, enough to continue the delay dynamics
+pub struct Checkpoint {
+    pub t: f64,
+    pub q: f64,
+    pub q_prime: f64,
+    pub p: f64,
+    pub th: f64,
+    pub temperature: f64,
+    pub delta: f64,
+    pub status: f64,
+    pub cnt: usize,
+    pub history: Vec<(f64, f64, f64, f64)>,
+    pub results: Vec<(f64, f64, f64, f64, f64)>,
+    pub power_spectrum: Vec<Vec<(f64, f64)>>,
 }
 
 #[derive(Debug, Deserialize)]
@@ -40,8 +60,11 @@ pub struct Params {
     pub rust: String,
 }
 
+// the config path can be given as the first argument, so that concurrent runs
+// can each point the binary to their own workspace
 pub fn load_config() -> Config {
-let config_content = fs::read_to_string("input/_config.toml").expect("Failed to read config file");
+let config_path = std::env::args().nth(1).unwrap_or("input/_config.toml".to_string());
+let config_content = fs::read_to_string(&config_path).expect("Failed to read config file");
   toml::from_str(&config_content).expect("Failed to parse config file")
 }
 